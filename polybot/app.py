@@ -1,7 +1,8 @@
 import flask
 from flask import request
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import os
-from bot import ObjectDetectionBot
+from bot import ObjectDetectionBot, is_valid_callback
 
 app = flask.Flask(__name__)
 
@@ -14,6 +15,11 @@ def index():
     return 'Ok'
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return flask.Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
 @app.route(f'/{TELEGRAM_TOKEN}/', methods=['POST'])
 def webhook():
     req = request.get_json()
@@ -21,5 +27,21 @@ def webhook():
     return 'Ok'
 
 
-bot = ObjectDetectionBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL)
-app.run(host='0.0.0.0', port=8443)
+@app.route('/predictions/<int(signed=True):chat_id>', methods=['POST'])
+def prediction_callback(chat_id):
+    # YOLO posts finished prediction jobs here
+    if not is_valid_callback(request.headers):
+        return 'Forbidden', 403
+    bot.handle_prediction_callback(chat_id, request.get_json())
+    return 'Ok'
+
+
+if __name__ == "__main__":
+    # Guarded so the filter worker processes can import this module without starting the bot
+    if os.environ.get('POLYBOT_SERVER', 'flask') == 'async':
+        # All the Telegram I/O is multiplexed on one asyncio event loop
+        from async_app import run_async_server
+        run_async_server(host='0.0.0.0', port=8443)
+    else:
+        bot = ObjectDetectionBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL)
+        app.run(host='0.0.0.0', port=8443)
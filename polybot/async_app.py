@@ -0,0 +1,136 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from aiohttp import web
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from loguru import logger
+from async_telegram import LoopTelegramClient
+from bot import ObjectDetectionBot, is_valid_callback
+
+TELEGRAM_TOKEN = os.environ['TELEGRAM_TOKEN']
+TELEGRAM_APP_URL = os.environ['TELEGRAM_APP_URL']
+
+# Threads running the Bot handlers. Photos are downloaded and Telegram sends are queued on the event loop,
+# and the CPU-bound filters run in the filter executor's processes.
+HANDLER_THREADS = int(os.environ.get('HANDLER_THREADS', 32))
+# Number of updates that may wait for a free handler thread before new ones are rejected
+HANDLER_QUEUE_DEPTH = int(os.environ.get('HANDLER_QUEUE_DEPTH', 8 * HANDLER_THREADS))
+
+
+def log_handler_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f'Error handling Telegram update: {future.exception()}')
+
+
+def acquire_handler_slot(app):
+    """
+    Returns:
+        bool: False if the handler queue is full and the update must be rejected.
+    """
+    if app['handler_slots'].acquire(blocking=False):
+        return True
+    logger.warning('Handler queue is full, rejecting update')
+    return False
+
+
+def run_handler(app, handler, *args, on_done=None):
+    """
+    Run a Bot handler in the executor without waiting for it, so the request is acknowledged immediately.
+    The slot taken by acquire_handler_slot is released when the handler finishes.
+    """
+    def finish(future):
+        app['handler_slots'].release()
+        if on_done is not None:
+            on_done()
+        log_handler_error(future)
+
+    future = asyncio.get_running_loop().run_in_executor(app['handler_executor'], handler, *args)
+    future.add_done_callback(finish)
+
+
+async def prefetch_photo(app, msg):
+    """
+    Download the photo the handler of the message needs on the event loop,
+    so the handler thread doesn't wait for Telegram.
+
+    Returns:
+        str: file_id of the prefetched photo, None if nothing was prefetched.
+    """
+    photo_size = app['bot'].photo_size_to_download(msg)
+    if photo_size is None:
+        return None
+    try:
+        await app['telegram_client'].prefetch(photo_size['file_id'])
+    except Exception as e:
+        # The handler downloads it again and answers the user if that fails too
+        logger.error(f'Error prefetching photo: {e}')
+        return None
+    return photo_size['file_id']
+
+
+async def index(request):
+    return web.Response(text='Ok')
+
+
+async def metrics(request):
+    return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+async def webhook(request):
+    req = await request.json()
+    app = request.app
+    # Telegram delivers the update again later
+    if not acquire_handler_slot(app):
+        return web.Response(status=503, text='Busy')
+
+    msg = req['message']
+    file_id = await prefetch_photo(app, msg)
+    on_done = None
+    if file_id is not None:
+        on_done = lambda: app['telegram_client'].forget_prefetched(file_id)
+    run_handler(app, app['bot'].handle_message, msg, on_done=on_done)
+    return web.Response(text='Ok')
+
+
+async def prediction_callback(request):
+    # YOLO posts finished prediction jobs here
+    if not is_valid_callback(request.headers):
+        return web.Response(status=403, text='Forbidden')
+    chat_id = int(request.match_info['chat_id'])
+    job = await request.json()
+    if not acquire_handler_slot(request.app):
+        return web.Response(status=503, text='Busy')
+    run_handler(request.app, request.app['bot'].handle_prediction_callback, chat_id, job)
+    return web.Response(text='Ok')
+
+
+async def close(app):
+    await app['telegram_client'].close()
+    app['handler_executor'].shutdown(wait=False)
+
+
+async def create_app():
+    loop = asyncio.get_running_loop()
+
+    app = web.Application()
+    app['handler_executor'] = ThreadPoolExecutor(max_workers=HANDLER_THREADS, thread_name_prefix='bot-handler')
+    # One slot per running or queued handler
+    app['handler_slots'] = threading.BoundedSemaphore(HANDLER_THREADS + HANDLER_QUEUE_DEPTH)
+    app['telegram_client'] = LoopTelegramClient(TELEGRAM_TOKEN, loop)
+
+    # The Bot constructor waits for Telegram through the loop, so it can't run on the loop thread
+    app['bot'] = await loop.run_in_executor(
+        app['handler_executor'],
+        lambda: ObjectDetectionBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL, telegram_bot_client=app['telegram_client']))
+
+    app.router.add_get('/', index)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_post(f'/{TELEGRAM_TOKEN}/', webhook)
+    app.router.add_post('/predictions/{chat_id:-?\\d+}', prediction_callback)
+    app.on_cleanup.append(close)
+    return app
+
+
+def run_async_server(host='0.0.0.0', port=8443):
+    web.run_app(create_app(), host=host, port=port)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from loguru import logger
+from telebot.async_telebot import AsyncTeleBot
+
+
+class LoopTelegramClient:
+    """
+    TeleBot-compatible client whose requests run on an asyncio event loop with AsyncTeleBot,
+    so the existing Bot handlers can be used unchanged by the async server.
+
+    Calls that return data the handler needs (get_file, download_file, ...) wait for it, unless
+    the file was prefetched on the loop.
+    Sends are queued on the loop and return immediately. Sends to the same chat keep their order.
+    Methods must be called from threads other than the loop's one (the handlers run in executors).
+    """
+
+    def __init__(self, token, loop):
+        self.async_client = AsyncTeleBot(token)
+        self.loop = loop
+        # chat id -> last send queued for the chat
+        self.last_sends = {}
+        # file_id -> File and file_path -> bytes of the photos downloaded ahead by prefetch
+        self.prefetched_files = {}
+        self.prefetched_data = {}
+        self.lock = threading.Lock()
+
+    def _call(self, coroutine):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            coroutine.close()
+            raise RuntimeError('Blocking Telegram calls cannot be made from the event loop thread')
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _send(self, chat_id, method, *args, **kwargs):
+        with self.lock:
+            previous = self.last_sends.get(chat_id)
+            future = asyncio.run_coroutine_threadsafe(
+                self._send_after(previous, chat_id, method, *args, **kwargs), self.loop)
+            self.last_sends[chat_id] = future
+        future.add_done_callback(lambda done: self._forget_send(chat_id, done))
+        return future
+
+    def _forget_send(self, chat_id, future):
+        with self.lock:
+            if self.last_sends.get(chat_id) is future:
+                del self.last_sends[chat_id]
+
+    async def _send_after(self, previous, chat_id, method, *args, **kwargs):
+        if previous is not None:
+            try:
+                await asyncio.wrap_future(previous)
+            except Exception:
+                pass  # Already logged by the previous send
+        try:
+            return await method(chat_id, *args, **kwargs)
+        except Exception as e:
+            logger.error(f'Error sending to Telegram chat {chat_id}: {e}')
+            raise
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._send(chat_id, self.async_client.send_message, text, **kwargs)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self._send(chat_id, self.async_client.send_photo, photo, **kwargs)
+
+    async def prefetch(self, file_id):
+        """
+        Download a file on the loop, so get_file and download_file answer without waiting for Telegram.
+        Call forget_prefetched once the handler is done with it.
+        """
+        file_info = await self.async_client.get_file(file_id)
+        data = await self.async_client.download_file(file_info.file_path)
+        with self.lock:
+            self.prefetched_files[file_id] = file_info
+            self.prefetched_data[file_info.file_path] = data
+
+    def forget_prefetched(self, file_id):
+        with self.lock:
+            file_info = self.prefetched_files.pop(file_id, None)
+            if file_info is not None:
+                self.prefetched_data.pop(file_info.file_path, None)
+
+    def get_file(self, file_id):
+        with self.lock:
+            file_info = self.prefetched_files.get(file_id)
+        if file_info is not None:
+            return file_info
+        return self._call(self.async_client.get_file(file_id))
+
+    def download_file(self, file_path):
+        with self.lock:
+            data = self.prefetched_data.get(file_path)
+        if data is not None:
+            return data
+        return self._call(self.async_client.download_file(file_path))
+
+    def remove_webhook(self):
+        return self._call(self.async_client.remove_webhook())
+
+    def set_webhook(self, **kwargs):
+        return self._call(self.async_client.set_webhook(**kwargs))
+
+    def get_me(self):
+        return self._call(self.async_client.get_me())
+
+    async def close(self):
+        try:
+            await self.async_client.close_session()
+        except AttributeError:
+            pass  # No request was ever made, so there is no session to close
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of Bot.handle_message intent routing: the former if/elif chain against the
+compiled IntentMatcher. Run from the polybot directory:
+
+    python bench_routing.py [number_of_rounds]
+"""
+import json
+import sys
+import timeit
+from intents import IntentMatcher
+
+INFO_FILTERS = ['blur', 'contour', 'rotate', 'salt and pepper', 'segment', 'random colors', 'predict']
+REMINDER_FILTERS = ['blur', 'contour', 'rotate', 'salt and pepper', 'segment', 'random color', 'predict']
+
+MESSAGES = [
+    'hi',
+    'Hello there bot',
+    'how are you today?',
+    'thanks a lot!',
+    'which filters do you have',
+    'help me please',
+    'what is blur?',
+    'What is salt and pepper',
+    'I want to rotate my picture',
+    'random colors please',
+    'nothing relevant in this sentence at all, just a long message that matches no intent whatsoever',
+]
+
+
+def legacy_classify(text):
+    """
+    The routing conditions of the former Bot.handle_message if/elif chain.
+    """
+    if any(word.lower() in ['hi', 'hello'] for word in text.split()):
+        return 'greetings', None
+    elif any(word in text.lower() for word in ['how are you', 'how you doing']):
+        return 'well_being', None
+    elif any(word in text.lower() for word in ['thank']):
+        return 'thanks', None
+    elif any(word in text.lower() for word in ['filter', 'which filters']):
+        return 'filter', None
+    elif any(word in text.lower() for word in ['help']):
+        return 'help', None
+    elif 'what is' in text.lower() and any(word in text.lower() for word in INFO_FILTERS):
+        return 'filter_info', next((word for word in INFO_FILTERS if word in text.lower()), None)
+    elif any(word in text.lower() for word in REMINDER_FILTERS):
+        return 'filter_reminder', None
+    return 'default', None
+
+
+def main(rounds=20000):
+    with open('responses.json', 'r') as file:
+        responses = json.load(file)
+    matcher = IntentMatcher(responses['intents'], responses['filter_keywords'])
+
+    for message in MESSAGES:
+        print(f'{message!r:45.45} legacy={legacy_classify(message)[0]:16} matcher={matcher.classify(message)[0]}')
+
+    legacy_seconds = timeit.timeit(lambda: [legacy_classify(message) for message in MESSAGES], number=rounds)
+    matcher_seconds = timeit.timeit(lambda: [matcher.classify(message) for message in MESSAGES], number=rounds)
+
+    total = rounds * len(MESSAGES)
+    print(f'\nlegacy if/elif chain: {total / legacy_seconds:12,.0f} messages/s')
+    print(f'compiled matcher:     {total / matcher_seconds:12,.0f} messages/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
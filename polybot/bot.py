@@ -1,28 +1,62 @@
-import telebot
 from loguru import logger
+import hmac
 import os
 import time
-from telebot.types import InputFile
+from io import BytesIO
+from concurrent.futures import Future
 import random
-import boto3
-import requests
-import json
-from img_proc import Img
 from responses import load_responses
 from detect_filters import Detect_Filters
-from filters import Filters
+from filters import Filters, FILTER_KEYWORDS, FILTER_MAX_PIXELS
+from intents import IntentMatcher
+from filter_executor import FilterExecutor, FILTER_WORKERS
+from result_cache import FilteredPhotoCache
 
 BOT_TOKEN = os.environ['TELEGRAM_TOKEN']
 yolo_container_name = os.environ['yolo_container_name']
-
+# Base URL YOLO can reach polybot on (e.g. http://polybot_app:8443). When set, predictions run as
+# background jobs and YOLO posts the result back, instead of holding the webhook thread.
+YOLO_CALLBACK_URL = os.environ.get('YOLO_CALLBACK_URL')
+# Shared secret YOLO sends in the X-Callback-Secret header of its callbacks. Callbacks without it are
+# rejected, so callback mode needs both YOLO_CALLBACK_URL and YOLO_CALLBACK_SECRET.
+YOLO_CALLBACK_SECRET = os.environ.get('YOLO_CALLBACK_SECRET')
+CALLBACK_SECRET_HEADER = 'X-Callback-Secret'
+if YOLO_CALLBACK_URL and not YOLO_CALLBACK_SECRET:
+    logger.warning('YOLO_CALLBACK_URL is set without YOLO_CALLBACK_SECRET, waiting for YOLO predictions instead')
+    YOLO_CALLBACK_URL = None
+# Seconds to wait for the YOLO service
+YOLO_TIMEOUT = float(os.environ.get('YOLO_TIMEOUT', 120))
+# 'memory' filters the downloaded photos from memory and uploads the result from memory,
+# 'disk' writes them under photos/ first
+PHOTO_STORAGE = os.environ.get('PHOTO_STORAGE', 'memory')
+# 'chat' seeds the noise filters with the chat ID, so a chat gets the same noise for the same photo.
+# 'random' seeds them from the OS. Either way, "seed <n>" in the caption wins.
+NOISE_SEED = os.environ.get('NOISE_SEED', 'random')
+
+
+
+def is_valid_callback(headers):
+    """
+    Parameters:
+        headers (Mapping): Headers of a request to the predictions callback route.
+
+    Returns:
+        bool: True if the request carries YOLO_CALLBACK_SECRET. Always False if no secret is configured.
+    """
+    if not YOLO_CALLBACK_SECRET:
+        return False
+    return hmac.compare_digest(headers.get(CALLBACK_SECRET_HEADER, ''), YOLO_CALLBACK_SECRET)
 
 
 class Bot:
 
-    def __init__(self, token, telegram_chat_url):
-        # create a new instance of the TeleBot class.
+    def __init__(self, token, telegram_chat_url, telegram_bot_client=None):
+        # create a new instance of the TeleBot class, unless a compatible client is given (see async_telegram.py).
         # all communication with Telegram servers are done using self.telegram_bot_client
-        self.telegram_bot_client = telebot.TeleBot(token)
+        if telegram_bot_client is None:
+            import telebot
+            telegram_bot_client = telebot.TeleBot(token)
+        self.telegram_bot_client = telegram_bot_client
 
         # remove any existing webhooks configured in Telegram servers
         self.telegram_bot_client.remove_webhook()
@@ -35,6 +69,19 @@ class Bot:
         # Load responses from the JSON file
         self.responses = load_responses()
 
+        # Intent of a text message -> its reply
+        self.intent_matcher = IntentMatcher(self.responses['intents'], self.responses['filter_keywords'])
+        self.intent_handlers = {
+            'greetings': self.reply_greetings,
+            'well_being': self.reply_well_being,
+            'thanks': self.reply_thanks,
+            'filter': self.reply_filter,
+            'help': self.reply_help,
+            'filter_info': self.reply_filter_info,
+            'filter_reminder': self.reply_filter_reminder,
+            'default': self.reply_default,
+        }
+
     def send_text(self, chat_id, text):
         self.telegram_bot_client.send_message(chat_id, text)
 
@@ -44,31 +91,81 @@ class Bot:
     def is_current_msg_photo(self, msg):
         return 'photo' in msg
 
-    def download_user_photo(self, msg):
+    def select_photo_size(self, msg, max_pixels=None):
         """
-        Downloads the photos that sent to the Bot to `photos` directory (should be existed)
-        :return:
+        Telegram offers every photo in several sizes. Selects the smallest one with at least max_pixels
+        pixels, or the largest if none is that large. The photo is then brought within the budget by
+        the smallest integer downscale factor (see img_proc.downscale_factor), so it can end up well under it.
+
+        Parameters:
+            msg (dict): The photo message.
+            max_pixels (int): Pixel budget, None for the largest size.
+
+        Returns:
+            dict: The selected PhotoSize.
+        """
+        photo_sizes = msg['photo']
+        if max_pixels:
+            large_enough = [size for size in photo_sizes
+                            if size.get('width', 0) * size.get('height', 0) >= max_pixels]
+            if large_enough:
+                return min(large_enough, key=lambda size: size['width'] * size['height'])
+        return photo_sizes[-1]
+
+    def download_user_photo_bytes(self, msg, max_pixels=None):
+        """
+        Downloads the photo that sent to the Bot, without writing it to disk.
+
+        Parameters:
+            msg (dict): The photo message.
+            max_pixels (int): Pixel budget, see select_photo_size.
+
+        Returns:
+            file_path (str): The photo's path on Telegram servers (e.g. photos/file_1.jpg).
+            data (bytes): The photo.
         """
         if not self.is_current_msg_photo(msg):
             raise RuntimeError(f'Message content of type \'photo\' expected')
 
-        file_info = self.telegram_bot_client.get_file(msg['photo'][-1]['file_id'])
+        file_info = self.telegram_bot_client.get_file(self.select_photo_size(msg, max_pixels)['file_id'])
         data = self.telegram_bot_client.download_file(file_info.file_path)
-        folder_name = file_info.file_path.split('/')[0]
+        return file_info.file_path, data
+
+    def download_user_photo(self, msg, max_pixels=None):
+        """
+        Downloads the photos that sent to the Bot to `photos` directory (should be existed)
+        :return:
+        """
+        file_path, data = self.download_user_photo_bytes(msg, max_pixels)
+        folder_name = file_path.split('/')[0]
 
         if not os.path.exists(folder_name):
             os.makedirs(folder_name)
 
-        with open(file_info.file_path, 'wb') as photo:
+        with open(file_path, 'wb') as photo:
             photo.write(data)
 
-        return file_info.file_path
+        return file_path
+
+    def send_photo(self, chat_id, img_path, file_name=None):
+        """
+        Parameters:
+            chat_id (int): Chat ID to send the photo to.
+            img_path (str or bytes): Path of the photo, or the encoded photo itself.
+            file_name (str): File name to upload encoded photos with.
+
+        Returns:
+            The sent Message, or a Future of it with the async client.
+        """
+        from telebot.types import InputFile
+
+        if isinstance(img_path, bytes):
+            return self.telegram_bot_client.send_photo(chat_id, InputFile(BytesIO(img_path), file_name))
 
-    def send_photo(self, chat_id, img_path):
         if not os.path.exists(img_path):
             raise RuntimeError("Image path doesn't exist")
 
-        self.telegram_bot_client.send_photo(
+        return self.telegram_bot_client.send_photo(
             chat_id,
             InputFile(img_path)
         )
@@ -78,62 +175,57 @@ class Bot:
 
         logger.info(f'Incoming message: {msg}')
 
-        # Check if the user's message contains a greeting
-        if 'text' in msg and any(word.lower() in ['hi', 'hello'] for word in msg['text'].split()):
-            greeting_response = random.choice(self.responses['greetings'])
-            self.send_text(msg['chat']['id'], greeting_response)
-        elif 'text' in msg and any(word in msg['text'].lower() for word in ['how are you', 'how you doing']):
-            well_being_response = random.choice(self.responses['well_being'])
-            self.send_text(msg['chat']['id'], well_being_response)
-        elif 'text' in msg and any(word in msg['text'].lower() for word in ['thank']):
-            thanks_response = random.choice(self.responses['thanks'])
-            self.send_text(msg['chat']['id'], thanks_response)
-        elif 'text' in msg and any(word in msg['text'].lower() for word in ['filter', 'which filters']):
-            filter_response_intro = random.choice(self.responses['filter']['intro'])
-            filter_response_options = "\n".join(self.responses['filter']['options'])
-            full_filter_response = f"{filter_response_intro}\n\nAvailable Filters:\n{filter_response_options}"
-            self.send_text(msg['chat']['id'], full_filter_response)
-        elif 'text' in msg and any(word in msg['text'].lower() for word in ['help']):
-            help_response = '\n'.join(self.responses['help'])
-            self.send_text(msg['chat']['id'], help_response)
-        elif 'text' in msg and 'what is' in msg['text'].lower() and any(word in msg['text'].lower() for word in
-                                                                        ['blur', 'contour', 'rotate', 'salt and pepper',
-                                                                         'segment', 'random colors', 'predict']):
-            # Extract the filter mentioned in the message
-            mentioned_filter = next((word for word in
-                                     ['blur', 'contour', 'rotate', 'salt and pepper', 'segment', 'random colors',
-                                      'predict'] if word in msg['text'].lower()), None)
-            if mentioned_filter:
-                # Provide relevant information based on the mentioned filter
-                if mentioned_filter == 'blur':
-                    self.send_text(msg['chat']['id'], self.responses['blur_info'])
-                elif mentioned_filter == 'contour':
-                    self.send_text(msg['chat']['id'], self.responses['contour_info'])
-                elif mentioned_filter == 'rotate':
-                    self.send_text(msg['chat']['id'], self.responses['rotate_info'])
-                elif mentioned_filter == 'salt_and_pepper':
-                    self.send_text(msg['chat']['id'], self.responses['salt and pepper_info'])
-                elif mentioned_filter == 'segment':
-                    self.send_text(msg['chat']['id'], self.responses['segment_info'])
-                elif mentioned_filter == 'random colors':
-                    self.send_text(msg['chat']['id'], self.responses['random_colors_info'])
-                elif mentioned_filter == 'predict':
-                    self.send_text(msg['chat']['id'], self.responses['predict_info'])
-
-        elif 'text' in msg and any(word in msg['text'].lower() for word in ['blur', 'contour', 'rotate', 'salt and pepper', 'segment', 'random color', 'predict']):
-            self.send_text(msg['chat']['id'], "Don't forget to send photo")
+        # Classify the text in one pass and dispatch to the intent's reply
+        if 'text' in msg:
+            intent, mentioned_filter = self.intent_matcher.classify(msg['text'])
         else:
-            # If no greeting or well-being question, respond with the original message
-            default_response = random.choice(self.responses['default'])
-            self.send_text(msg['chat']['id'], default_response)
+            intent, mentioned_filter = 'default', None
+        self.intent_handlers[intent](msg, mentioned_filter)
+
+    def reply_greetings(self, msg, mentioned_filter):
+        greeting_response = random.choice(self.responses['greetings'])
+        self.send_text(msg['chat']['id'], greeting_response)
+
+    def reply_well_being(self, msg, mentioned_filter):
+        well_being_response = random.choice(self.responses['well_being'])
+        self.send_text(msg['chat']['id'], well_being_response)
+
+    def reply_thanks(self, msg, mentioned_filter):
+        thanks_response = random.choice(self.responses['thanks'])
+        self.send_text(msg['chat']['id'], thanks_response)
+
+    def reply_filter(self, msg, mentioned_filter):
+        filter_response_intro = random.choice(self.responses['filter']['intro'])
+        filter_response_options = "\n".join(self.responses['filter']['options'])
+        full_filter_response = f"{filter_response_intro}\n\nAvailable Filters:\n{filter_response_options}"
+        self.send_text(msg['chat']['id'], full_filter_response)
+
+    def reply_help(self, msg, mentioned_filter):
+        help_response = '\n'.join(self.responses['help'])
+        self.send_text(msg['chat']['id'], help_response)
+
+    def reply_filter_info(self, msg, mentioned_filter):
+        # Provide relevant information based on the mentioned filter
+        self.send_text(msg['chat']['id'], self.responses[self.responses['filter_keywords'][mentioned_filter]])
+
+    def reply_filter_reminder(self, msg, mentioned_filter):
+        self.send_text(msg['chat']['id'], "Don't forget to send photo")
+
+    def reply_default(self, msg, mentioned_filter):
+        # If no greeting or well-being question, respond with the original message
+        default_response = random.choice(self.responses['default'])
+        self.send_text(msg['chat']['id'], default_response)
 
 
 class ObjectDetectionBot(Bot):
 
-    def __init__(self, token, telegram_chat_url):
-        super().__init__(token, telegram_chat_url)
+    def __init__(self, token, telegram_chat_url, telegram_bot_client=None):
+        super().__init__(token, telegram_chat_url, telegram_bot_client)
         self.responses = load_responses()
-        self.s3 = boto3.client('s3')
+        # Run the CPU-bound filters in worker processes, so the webhook is acknowledged immediately
+        self.filter_executor = FilterExecutor() if FILTER_WORKERS > 0 else None
+        # Photos already filtered, re-sent by their Telegram file_id
+        self.result_cache = FilteredPhotoCache()
 
     def call_yolo_service(self, new_photo_path, chat_id):
         """
@@ -142,6 +234,9 @@ class ObjectDetectionBot(Bot):
         Parameters:
             new_photo_path (str): The new path to the photo file locally, from "rename_photo_with_timestamp" method.
             chat_id (int): Chat ID obtained from the incoming message.
+
+        Returns:
+            prediction_results (dict): The prediction summary returned by YOLO, None on error.
         """
 
         try:
@@ -159,21 +254,16 @@ class ObjectDetectionBot(Bot):
 
             logger.info(f'yolo5_url_correct: {yolo5_url_corrected}')
 
-            response = requests.post(yolo5_url_corrected)
+            import requests
+            response = requests.post(yolo5_url_corrected, timeout=YOLO_TIMEOUT)
 
             logger.info(f'response')
 
             if response.status_code == 200:
-                # Process the prediction results returned by the service
+                # The prediction results of this request are kept in memory, never shared through a file
                 prediction_results = response.json()
-
-                # Save the prediction results to a JSON file
-                json_file_path = "prediction_summary.json"  # Remove last four characters from new_photo_path
-                with open(json_file_path, 'w') as json_file:
-                    json.dump(prediction_results, json_file)
-
-                logger.info(f"Prediction results saved to {json_file_path}")
-                return json_file_path
+                logger.info(f"Prediction results received: {prediction_results.get('prediction_id')}")
+                return prediction_results
 
             elif response.status_code == 404:
 
@@ -184,6 +274,91 @@ class ObjectDetectionBot(Bot):
         except Exception as e:
             logger.error(f"Error calling YOLOv5 service: {e}")
 
+    def submit_yolo_job(self, new_photo_path, chat_id):
+        """
+        Queues a prediction of the photo in YOLO. YOLO posts the result to the predictions
+        callback route of this chat when it is ready (see handle_prediction_callback).
+
+        Parameters:
+            new_photo_path (str): The new path to the photo file locally, from "rename_photo_with_timestamp" method.
+            chat_id (int): Chat ID obtained from the incoming message.
+
+        Returns:
+            job_id (str): The YOLO job id, None on error.
+        """
+        try:
+            import requests
+            # The callback URL goes in the body, so it stays out of YOLO's access log
+            response = requests.post(
+                f"http://{yolo_container_name}:8081/predict",
+                params={'imgName': new_photo_path},
+                json={'callbackUrl': f"{YOLO_CALLBACK_URL}/predictions/{chat_id}"},
+                timeout=YOLO_TIMEOUT)
+
+            if response.status_code == 202:
+                job_id = response.json()['job_id']
+                logger.info(f"Prediction job {job_id} queued for chat {chat_id}")
+                return job_id
+
+            logger.error(f"Error: {response.status_code} - {response.text}")
+        except Exception as e:
+            logger.error(f"Error calling YOLOv5 service: {e}")
+
+        no_permission_response = random.choice(self.responses['photo_errors']['permissions_error'])
+        self.send_text(chat_id, no_permission_response)
+
+    def handle_prediction_callback(self, chat_id, job):
+        """
+        Handles a finished prediction job posted back by YOLO.
+
+        Parameters:
+            chat_id (int): Chat ID the prediction was requested from.
+            job (dict): The YOLO job, with 'status', 'status_code' and 'result'.
+        """
+        logger.info(f"Prediction job {job.get('job_id')} finished: {job.get('status')}")
+
+        if job.get('status_code') == 200:
+            self.handle_prediction_results(chat_id, job['result'])
+        elif job.get('status_code') == 404:
+            self.send_text(chat_id, "Error processing the photo")
+        else:
+            logger.error(f"Error: {job.get('status_code')} - {job.get('result')}")
+
+    def handle_prediction_results(self, chat_id, prediction_results, detect_filters_instance=None):
+        """
+        Processes the prediction results and sends them to the Telegram user.
+
+        Parameters:
+            chat_id (int): Chat ID obtained from the incoming message.
+            prediction_results (dict): The prediction summary returned by YOLO.
+            detect_filters_instance (Detect_Filters): Instance of the request, if there is one.
+        """
+        if detect_filters_instance is None:
+            detect_filters_instance = Detect_Filters(prediction_results.get('original_img_path'))
+
+        # Processes the prediction results
+        try:
+            processed_results = detect_filters_instance.process_prediction_results(prediction_results)
+        except KeyError as e:
+            logger.error(f"Error parsing prediction results: {e}")
+            return None
+
+        # Add variable in case it fails to generate it
+        processed_results_message = ""
+
+        # Send the prediction results to Telegram user
+        try:
+            processed_results_message = detect_filters_instance.send_prediction_results_to_telegram(processed_results)
+        except Exception as e:
+            logger.error(f"Error sending prediction results to Telegram: {e}")
+
+        # Check if the processed results message exist
+        if processed_results_message:
+            # Send the processed results message to the Telegram user
+            self.send_telegram_message(chat_id, processed_results_message)
+        else:
+            logger.error("Error sending prediction results message.")
+
     def send_telegram_message(self, chat_id, message):
         """
         Sends a message to the Telegram user.
@@ -193,16 +368,8 @@ class ObjectDetectionBot(Bot):
         """
 
         try:
-            # TODO get the telegram app URL from the enviournment variables
             # Send the message to the Telegram end-user using the obtained chat ID
-            telegram_api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-            payload = {
-                'chat_id': chat_id,
-                'text': message
-            }
-            response = requests.post(telegram_api_url, json=payload)
-            if response.status_code != 200:
-                logger.error(f"Error sending message to Telegram: {response.text}")
+            self.telegram_bot_client.send_message(chat_id, message)
         except Exception as e:
             logger.error(f"Error sending message to Telegram: {e}")
 
@@ -213,24 +380,42 @@ class ObjectDetectionBot(Bot):
         if 'photo' in msg:
             if 'caption' in msg:
                 photo_caption = msg['caption'].lower()
+                caption_filters = self.intent_matcher.filters_in(photo_caption)
 
                 try:
                     # Check for specific keywords in the caption to determine the filter to apply
-                    if ('blur' in photo_caption or
-                            'contour' in photo_caption or
-                            'rotate' in photo_caption or
-                            'salt and pepper' in photo_caption or
-                            'segment' in photo_caption or
-                            'random color' in photo_caption):
+                    if caption_filters & FILTER_KEYWORDS.keys():
+                        # The same photo with the same filters was already sent, send it again
+                        seed, cache_key = self.filter_cache_key(msg, photo_caption)
+                        if cache_key and self.send_cached_photo(msg['chat']['id'], cache_key):
+                            return
+
                         # Download the photo
-                        img_path = self.download_user_photo(msg)
-                        # create instance variables
-                        filters_instance = Filters(photo_caption, img_path)
-                        processed_img_path, filter_name = filters_instance.image_processing()
-                        # Send the processed image to the user
-                        self.send_photo(msg['chat']['id'], processed_img_path)
-                        self.send_text(msg['chat']['id'], f'{filter_name} filter applied successfully.')
-                    elif 'predict' in photo_caption:
+                        # A smaller size is enough for the filters, the detection below keeps the largest
+                        if PHOTO_STORAGE == 'memory':
+                            img_path, img_bytes = self.download_user_photo_bytes(msg, FILTER_MAX_PIXELS)
+                        else:
+                            img_path, img_bytes = self.download_user_photo(msg, FILTER_MAX_PIXELS), None
+                        file_name = os.path.basename(img_path)
+                        if self.filter_executor:
+                            # The result is sent to the user when the worker finishes
+                            chat_id = msg['chat']['id']
+                            submitted = self.filter_executor.submit(
+                                photo_caption, img_path,
+                                lambda future: self.deliver_filtered_photo(chat_id, future, file_name, cache_key),
+                                img_bytes, seed)
+                            if not submitted:
+                                queue_full_response = random.choice(self.responses['photo_errors']['queue_full'])
+                                self.send_text(chat_id, queue_full_response)
+                        else:
+                            # create instance variables
+                            filters_instance = Filters(photo_caption, img_path, img_bytes, seed)
+                            processed_img, filter_name = filters_instance.image_processing()
+                            # Send the processed image to the user
+                            sent = self.send_photo(msg['chat']['id'], processed_img, file_name)
+                            self.remember_sent_photo(cache_key, sent, filter_name)
+                            self.send_text(msg['chat']['id'], f'{filter_name} filter applied successfully.')
+                    elif 'predict' in caption_filters:
                         self.object_detection(msg)
                     else:
                         # If no specific filter is mentioned, respond with a default message
@@ -249,6 +434,115 @@ class ObjectDetectionBot(Bot):
         else:
             super().handle_message(msg)
 
+    def filter_cache_key(self, msg, photo_caption):
+        """
+        Parameters:
+            msg (dict): The photo message.
+            photo_caption (str): The photo caption, lower case.
+
+        Returns:
+            seed (int): Seed of the noise filters, None to seed them from the OS.
+            cache_key (tuple): Key of the filtered photo in the result cache, see Filters.cache_key.
+        """
+        # Seeds must be non-negative, group chat IDs are negative
+        seed = abs(msg['chat']['id']) if NOISE_SEED == 'chat' else None
+        return seed, Filters(photo_caption, None, seed=seed).cache_key(msg['photo'][-1].get('file_unique_id'))
+
+    def photo_size_to_download(self, msg):
+        """
+        The photo size handle_message downloads for the message, so the async server can download it ahead.
+
+        Parameters:
+            msg (dict): The incoming message.
+
+        Returns:
+            dict: The PhotoSize, None if no photo is downloaded (no caption, nothing to apply,
+                or the filtered photo is in the result cache).
+        """
+        if 'photo' not in msg or 'caption' not in msg:
+            return None
+
+        photo_caption = msg['caption'].lower()
+        caption_filters = self.intent_matcher.filters_in(photo_caption)
+        if caption_filters & FILTER_KEYWORDS.keys():
+            seed, cache_key = self.filter_cache_key(msg, photo_caption)
+            if cache_key and cache_key in self.result_cache:
+                return None
+            return self.select_photo_size(msg, FILTER_MAX_PIXELS)
+        if 'predict' in caption_filters:
+            return self.select_photo_size(msg)
+        return None
+
+    def send_cached_photo(self, chat_id, cache_key):
+        """
+        Sends a filtered photo from the result cache by its Telegram file_id.
+
+        Parameters:
+            chat_id (int): Chat ID obtained from the incoming message.
+            cache_key (tuple): See Filters.cache_key.
+
+        Returns:
+            bool: False if the photo is not in the cache or could not be sent.
+        """
+        file_id, filter_name = self.result_cache.get(cache_key)
+        if file_id is None:
+            return False
+
+        try:
+            sent = self.telegram_bot_client.send_photo(chat_id, file_id)
+            # The async client sends in the background, wait for it to know the file_id still works
+            if isinstance(sent, Future):
+                sent.result()
+        except Exception as e:
+            logger.error(f"Error re-sending cached photo, filtering it again: {e}")
+            self.result_cache.evict(cache_key)
+            return False
+
+        self.result_cache.record_hit()
+        self.send_text(chat_id, f'{filter_name} filter applied successfully.')
+        return True
+
+    def remember_sent_photo(self, cache_key, sent, filter_name):
+        """
+        Stores the file_id Telegram gave the filtered photo in the result cache.
+
+        Parameters:
+            cache_key (tuple): See Filters.cache_key, None if the result is not cacheable.
+            sent (Message or Future): What send_photo returned.
+            filter_name (str): Names of the applied filters.
+        """
+        if cache_key is None:
+            return
+
+        def remember(message):
+            self.result_cache.put(cache_key, message.photo[-1].file_id, filter_name)
+
+        # The async client sends in the background and returns a future of the message
+        if isinstance(sent, Future):
+            sent.add_done_callback(lambda done: done.exception() is None and remember(done.result()))
+        elif sent is not None:
+            remember(sent)
+
+    def deliver_filtered_photo(self, chat_id, future, file_name=None, cache_key=None):
+        """
+        Sends the result of a filter job from the filter executor to the Telegram user.
+
+        Parameters:
+            chat_id (int): Chat ID obtained from the incoming message.
+            future (Future): The finished filter job.
+            file_name (str): File name of the photo, used if the result is in memory.
+            cache_key (tuple): Key of the result in the result cache, None if it is not cacheable.
+        """
+        try:
+            processed_img, filter_name = future.result()
+            sent = self.send_photo(chat_id, processed_img, file_name)
+            self.remember_sent_photo(cache_key, sent, filter_name)
+            self.send_text(chat_id, f'{filter_name} filter applied successfully.')
+        except Exception as e:
+            logger.error(f"Error applying filter: {e}")
+            no_permission_response = random.choice(self.responses['photo_errors']['permissions_error'])
+            self.send_text(chat_id, no_permission_response)
+
     def object_detection(self, msg):
         if self.is_current_msg_photo(msg):
             photo_path = self.download_user_photo(msg)
@@ -266,7 +560,6 @@ class ObjectDetectionBot(Bot):
 
                 # Upload the photo to S3 and make sure the directory exists
                 try:
-                    detect_filters_instance = Detect_Filters(new_photo_path)
                     s3_key = detect_filters_instance.upload_photo_to_s3(new_photo_path)
                 except Exception as e:
                     logger.error(f"Error uploading photo to S3: {e}")
@@ -276,36 +569,18 @@ class ObjectDetectionBot(Bot):
                 chat_id = msg['chat']['id']
 
                 if s3_key:
-                    # Call the YOLOv5 service
-                    json_file_path = self.call_yolo_service(new_photo_path, chat_id)
-
-                    # Processes the json results file
-                    try:
-                        detect_filters_instance = Detect_Filters(json_file_path)
-                        processed_results = detect_filters_instance.process_prediction_results(json_file_path)
-                    except FileNotFoundError as e:
-                        logger.error(f"Error: Prediction results file not found: {e}")
-                        return None
-                    except KeyError as e:
-                        logger.error(f"Error parsing prediction results: {e}")
+                    if YOLO_CALLBACK_URL:
+                        # The results are sent when YOLO posts them back
+                        self.submit_yolo_job(new_photo_path, chat_id)
                         return None
 
-                    # Add variable in case it fails to generate it
-                    processed_results_message = ""
-
-                    # Send the prediction results to Telegram user
-                    try:
-                        detect_filters_instance = Detect_Filters(processed_results)
-                        processed_results_message = detect_filters_instance.send_prediction_results_to_telegram(processed_results)
-                    except Exception as e:
-                        logger.error(f"Error sending prediction results to Telegram: {e}")
+                    # Call the YOLOv5 service
+                    prediction_results = self.call_yolo_service(new_photo_path, chat_id)
+                    if prediction_results is None:
+                        logger.error("Error: No prediction results received")
+                        return None
 
-                    # Check if the processed results message exist
-                    if processed_results_message:
-                        # Send the processed results message to the Telegram user
-                        self.send_telegram_message(chat_id, processed_results_message)
-                    else:
-                        logger.error("Error sending prediction results message.")
+                    self.handle_prediction_results(chat_id, prediction_results, detect_filters_instance)
                 else:
                     logger.error("Error uploading photo to S3.")
             else:
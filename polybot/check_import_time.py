@@ -0,0 +1,83 @@
+"""
+Import-time budget check of polybot's startup. Imports app.py in a fresh interpreter under
+`python -X importtime`, prints the slowest imports, and exits with status 1 if the import takes
+longer than the budget or if a module that should only load on first use was imported.
+Run from the polybot directory:
+
+    python check_import_time.py [budget_ms] [report_file]
+
+report_file receives the raw `-X importtime` output.
+"""
+import os
+import subprocess
+import sys
+
+# Milliseconds `import app` may take
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 500))
+
+# Modules loaded on first use only (photos, S3 uploads, YOLO calls)
+LAZY_MODULES = ['matplotlib', 'PIL', 'numpy', 'img_proc', 'boto3', 'botocore', 'telebot', 'requests']
+
+# Required by app.py and bot.py at import time, the values don't matter
+PLACEHOLDER_ENVIRONMENT = {
+    'TELEGRAM_TOKEN': 'import-time-check',
+    'TELEGRAM_APP_URL': 'https://localhost',
+    'yolo_container_name': 'localhost',
+    'BUCKET_NAME': 'import-time-check',
+}
+
+
+def parse_importtime(output):
+    """
+    Parameters:
+        output (str): stderr of `python -X importtime`.
+
+    Returns:
+        list: (module, self_us, cumulative_us) of every import, in the order they finished.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main(budget_ms=IMPORT_TIME_BUDGET_MS, report_file=None):
+    env = {**PLACEHOLDER_ENVIRONMENT, **os.environ}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            capture_output=True, text=True)
+    if report_file:
+        with open(report_file, 'w') as file:
+            file.write(result.stderr)
+    if result.returncode != 0:
+        print(result.stderr)
+        return 1
+
+    imports = parse_importtime(result.stderr)
+    total_ms = next(cumulative for module, _, cumulative in imports if module == 'app') / 1000
+
+    print(f'{"module":40} {"self ms":>9} {"cumulative ms":>14}')
+    for module, self_us, cumulative_us in sorted(imports, key=lambda item: item[2], reverse=True)[:20]:
+        print(f'{module:40} {self_us / 1000:9.1f} {cumulative_us / 1000:14.1f}')
+
+    failed = False
+    print(f'\nimport app: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)')
+    if total_ms > budget_ms:
+        print('FAIL: startup import time is over budget')
+        failed = True
+
+    imported = {module for module, _, _ in imports}
+    eager = [lazy for lazy in LAZY_MODULES if lazy in imported]
+    if eager:
+        print(f'FAIL: imported at startup instead of on first use: {", ".join(eager)}')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_TIME_BUDGET_MS,
+                  sys.argv[2] if len(sys.argv) > 2 else None))
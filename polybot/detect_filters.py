@@ -1,22 +1,39 @@
 from datetime import datetime
+import itertools
 import os
-import boto3
-import json
+import threading
+import time
+import uuid
+from s3_client import get_s3_client, get_transfer_config
 
 images_bucket = os.environ['BUCKET_NAME']
 
+# Seconds before an S3 directory is checked again, 0 checks it once per process
+S3_DIRECTORY_CACHE_TTL = float(os.environ.get('S3_DIRECTORY_CACHE_TTL', 0))
+
+# (bucket, directory) -> time it was last known to exist, shared by all the instances
+_existing_directories = {}
+_existing_directories_lock = threading.Lock()
+
+# Sequence number of the renamed photos in this process, and a suffix telling this process
+# apart from the other replicas uploading to the same bucket
+_photo_sequence = itertools.count(1)
+_process_suffix = uuid.uuid4().hex[:8]
+
 
 class Detect_Filters:
 
     def __init__(self, photo_path):
         self.photo_path = photo_path
-        self.s3 = boto3.client('s3')
+        self.s3 = get_s3_client()
 
     def rename_photo_with_timestamp(self, photo_path):
         """
-        Rename a photo with a timestamp in the format 'yyyy-mm-dd HH:MM:SS'.
-        If multiple photos are saved within the same minute, append a counter
-        to the filename.
+        Rename a photo with a timestamp in the format 'yyyy-mm-dd HH:MM:SS.ffffff', followed by
+        the sequence number of the photo in this process and the process suffix,
+        e.g. '2024-05-01 12:30:05.123456 p000042-1a2b3c4d.jpg'.
+        The names sort by time, and are unique without listing the directory, even when
+        photos are renamed concurrently or by several replicas.
 
         Parameters:
             photo_path (str): The path to the photo file locally.
@@ -30,21 +47,14 @@ class Detect_Filters:
         current_time = datetime.now()
 
         # Format the datetime as required
-        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S.%f")
 
         # Get the file extension
         file_name, file_extension = os.path.splitext(photo_path)
 
-        # Check if there's already a photo saved in the same minute
-        same_minute_files = [f for f in os.listdir(os.path.dirname(photo_path)) if f.startswith(formatted_time)]
-
-        # Construct the new file name
-        if same_minute_files:
-            # Append a counter to the file name
-            counter = len(same_minute_files) + 1
-            new_file_name = f"{formatted_time} p{counter}{file_extension}"
-        else:
-            new_file_name = f"{formatted_time}{file_extension}"
+        # Construct the new file name, next() on the counter is atomic
+        counter = next(_photo_sequence)
+        new_file_name = f"{formatted_time} p{counter:06d}-{_process_suffix}{file_extension}"
 
         # Rename the file
         new_photo_path = os.path.join(os.path.dirname(photo_path), new_file_name.lstrip("/"))
@@ -60,6 +70,11 @@ class Detect_Filters:
             bucket (str): Bucket name.
             directory (str): Directory to check.
         """
+        with _existing_directories_lock:
+            checked_at = _existing_directories.get((bucket, directory))
+        if checked_at is not None and (not S3_DIRECTORY_CACHE_TTL or
+                                       time.monotonic() - checked_at < S3_DIRECTORY_CACHE_TTL):
+            return
 
         try:
             # Check if the directory exists by listing objects in the directory
@@ -71,6 +86,20 @@ class Detect_Filters:
             else:
                 raise  # Raise the exception if it's not a '404 Not Found' error
 
+        with _existing_directories_lock:
+            _existing_directories[(bucket, directory)] = time.monotonic()
+
+    def forget_s3_directories(self, bucket):
+        """
+        Drop the cached directories of a bucket, so the next upload checks them again.
+
+        Parameters:
+            bucket (str): Bucket name.
+        """
+        with _existing_directories_lock:
+            for key in [key for key in _existing_directories if key[0] == bucket]:
+                del _existing_directories[key]
+
     def upload_photo_to_s3(self, photo_path):
         """
         Upload the photo to S3 bucket.
@@ -81,15 +110,19 @@ class Detect_Filters:
         Returns:
             s3_key (str): The new path to the photo file in S3.
         """
+        from boto3.exceptions import S3UploadFailedError
+        from botocore.exceptions import ClientError
+
         # Specify the directory path in the bucket
         s3_directory_path = 'photos'
         s3_predicted_directory_path = 'predicted_photos'
         s3_json_folder = 'json'
 
-        # Ensure the directory exists in the S3 bucket
-        self.ensure_s3_directory_exists(images_bucket, s3_directory_path)
-        self.ensure_s3_directory_exists(images_bucket, s3_predicted_directory_path)
-        self.ensure_s3_directory_exists(images_bucket, s3_json_folder)
+        s3_directories = [s3_directory_path, s3_predicted_directory_path, s3_json_folder]
+
+        # Ensure the directory exists in the S3 bucket (checked once, then cached)
+        for directory in s3_directories:
+            self.ensure_s3_directory_exists(images_bucket, directory)
 
         # Extract filename from the path
         filename = os.path.basename(photo_path)
@@ -98,26 +131,28 @@ class Detect_Filters:
         s3_key = s3_directory_path + '/' + filename
 
         # Upload the photo to S3
-        self.s3.upload_file(photo_path, images_bucket, s3_key)
+        try:
+            self.s3.upload_file(photo_path, images_bucket, s3_key, Config=get_transfer_config())
+        except (ClientError, S3UploadFailedError):
+            # The cached directories may be gone, check them again and retry once
+            self.forget_s3_directories(images_bucket)
+            for directory in s3_directories:
+                self.ensure_s3_directory_exists(images_bucket, directory)
+            self.s3.upload_file(photo_path, images_bucket, s3_key, Config=get_transfer_config())
 
         # Return the S3 key
         return s3_key
 
-    def process_prediction_results(self, json_file_path):
+    def process_prediction_results(self, prediction_results):
         """
         Process the response from YOLO to the format required in the project.
 
         Parameters:
-            json_file_path (str): Path to the JSON file containing prediction results.
+            prediction_results (dict): Prediction summary returned by YOLO.
 
         Returns:
             processed_results (list): Processed prediction to the format required in the project.
         """
-        # Load the prediction results from the JSON file
-        with open(json_file_path, "r") as json_file:
-            prediction_results = json.load(json_file)
-
-        # Assuming prediction_results is a JSON object
         # Extract relevant information
         labels = prediction_results.get('labels', [])
 
@@ -0,0 +1,107 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+from loguru import logger
+from filters import Filters
+
+# Number of filter worker processes, 0 applies the filters in the webhook thread
+FILTER_WORKERS = int(os.environ.get('FILTER_WORKERS', os.cpu_count() or 1))
+# Number of filter jobs that may wait for a free worker before new ones are rejected
+FILTER_QUEUE_DEPTH = int(os.environ.get('FILTER_QUEUE_DEPTH', 2 * FILTER_WORKERS))
+
+
+def run_filters(photo_caption, img_path, img_bytes=None, seed=None):
+    """
+    Worker process entry point.
+
+    Parameters:
+        photo_caption (str): The photo caption, lower case.
+        img_path (str): The path to the downloaded photo.
+        img_bytes (bytes): The downloaded photo, if it was kept in memory.
+        seed (int): Seed of the noise filters.
+
+    Returns:
+        processed_img (Path or bytes): Path of the filtered image, or the encoded image.
+        filter_name (str): Names of the applied filters.
+    """
+    return Filters(photo_caption, img_path, img_bytes, seed).image_processing()
+
+
+class FilterExecutor:
+
+    def __init__(self, workers=FILTER_WORKERS, queue_depth=FILTER_QUEUE_DEPTH):
+        # forkserver starts the workers from a clean process that already imported the filters
+        self.mp_context = multiprocessing.get_context('forkserver')
+        self.mp_context.set_forkserver_preload(['filters', 'img_proc', 'matplotlib.image'])
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=self.mp_context)
+        self.pool_lock = threading.Lock()
+
+        # Results are delivered to Telegram from threads, so the pool's result thread never blocks on the network
+        self.delivery = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='filter-delivery')
+
+        # One slot per running or queued job
+        self.slots = threading.BoundedSemaphore(workers + queue_depth)
+        logger.info(f'Filter executor started with {workers} workers and queue depth {queue_depth}')
+
+    def submit(self, photo_caption, img_path, on_done, img_bytes=None, seed=None):
+        """
+        Queue a filter job without waiting for it.
+
+        Parameters:
+            photo_caption (str): The photo caption, lower case.
+            img_path (str): The path to the downloaded photo.
+            on_done (callable): Called with the job's future when it finishes.
+            img_bytes (bytes): The downloaded photo, if it was kept in memory.
+            seed (int): Seed of the noise filters.
+
+        Returns:
+            bool: False if the queue is full and the job was rejected.
+        """
+        if not self.slots.acquire(blocking=False):
+            logger.warning('Filter queue is full, rejecting job')
+            return False
+
+        try:
+            pool = self.pool
+            try:
+                future = pool.submit(run_filters, photo_caption, img_path, img_bytes, seed)
+            except BrokenProcessPool:
+                pool = self._replace_pool(pool)
+                future = pool.submit(run_filters, photo_caption, img_path, img_bytes, seed)
+        except Exception:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda done: self._finish(done, on_done, pool))
+        return True
+
+    def _finish(self, future, on_done, pool):
+        self.slots.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace_pool(pool)
+        self.delivery.submit(on_done, future)
+
+    def _replace_pool(self, broken_pool):
+        """
+        Start a new pool when a worker died (e.g. killed for running out of memory on a large photo),
+        which breaks the whole ProcessPoolExecutor. The jobs of the broken pool fail.
+
+        Parameters:
+            broken_pool (ProcessPoolExecutor): The pool the failure was seen on.
+
+        Returns:
+            ProcessPoolExecutor: The current pool.
+        """
+        with self.pool_lock:
+            if self.pool is broken_pool:
+                logger.error('A filter worker died, restarting the filter worker pool')
+                broken_pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.mp_context)
+            return self.pool
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.delivery.shutdown(wait=False)
@@ -1,47 +1,161 @@
-from img_proc import Img
+import os
+import re
+
+# Caption keyword -> (Img filter method, filter name shown to the user).
+# img_proc is imported with the first photo, so text-only processes never load numpy and matplotlib.
+FILTER_KEYWORDS = {
+    'blur': ('blur', 'Blur'),
+    'contour': ('contour', 'Contour'),
+    'rotate': ('rotate', 'Rotate'),
+    'salt and pepper': ('salt_n_pepper', 'Salt and Pepper'),
+    'segment': ('segment', 'Segment'),
+    'random color': ('random_colors', 'Random Colors'),
+}
+
+FILTER_KEYWORDS_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in FILTER_KEYWORDS))
+
+# Img storage of the filtered photos, 'uint8' keeps them in color (see Img)
+FILTER_STORAGE = os.environ.get('FILTER_STORAGE', 'numpy')
+# Pixel budget of the filtered photos, larger ones are downscaled first. 0 keeps the full resolution.
+FILTER_MAX_PIXELS = int(os.environ.get('FILTER_MAX_PIXELS', 0))
+
+# Filters drawing random noise (img_proc.RANDOM_FILTERS), their result is only reused with a seed
+NOISE_FILTER_KEYWORDS = {'salt and pepper', 'random color'}
+
+# "seed 42" in the caption makes the noise filters reproducible
+SEED_PATTERN = re.compile(r'\bseed\s+(\d+)')
+
 
 class Filters:
-    def __init__(self, photo_caption, img_path):
+    def __init__(self, photo_caption, img_path, img_bytes=None, seed=None):
+        """
+        Parameters:
+            photo_caption (str): The photo caption, lower case.
+            img_path (str): The path to the photo. Only names the photo when img_bytes is given.
+            img_bytes (bytes): The downloaded photo. When given, the photo is decoded from memory
+                and the filtered photo is returned encoded, instead of being written next to img_path.
+            seed (int): Seed of the noise filters, unless the caption has one. None seeds them from the OS.
+        """
         self.photo_caption = photo_caption
         self.img_path = img_path
+        self.img_bytes = img_bytes
+        self.seed = self.parse_seed(seed)
+
+    def parse_filter_chain(self):
+        """
+        Find the filters mentioned in the caption, in the order they appear
+        (e.g. "blur then contour then rotate").
+
+        Returns:
+            list: Caption keywords of the filters to apply.
+        """
+        return [match.group(0) for match in FILTER_KEYWORDS_PATTERN.finditer(self.photo_caption)]
+
+    def parse_seed(self, default_seed=None):
+        """
+        Returns:
+            int: The seed given in the caption (e.g. "salt and pepper seed 42"), or default_seed.
+        """
+        match = SEED_PATTERN.search(self.photo_caption)
+        if match:
+            return int(match.group(1))
+        return default_seed
+
+    def cache_key(self, file_unique_id):
+        """
+        Key of the filtered photo in the result cache (see result_cache.py).
+
+        Parameters:
+            file_unique_id (str): Telegram file_unique_id of the original photo.
+
+        Returns:
+            tuple: (file_unique_id, Img methods of the chain, seed), None if the result can't be reused.
+        """
+        filter_chain = self.parse_filter_chain()
+        if not file_unique_id or not filter_chain:
+            return None
+
+        # The same photo and chain give the same result, unless there is random noise without a seed
+        has_noise = bool(NOISE_FILTER_KEYWORDS.intersection(filter_chain))
+        if has_noise and self.seed is None:
+            return None
+        return file_unique_id, tuple(FILTER_KEYWORDS[keyword][0] for keyword in filter_chain), \
+            self.seed if has_noise else None
 
     def image_processing(self):
-        if 'blur' in self.photo_caption:
-            return self.apply_blur_filter()
-        elif 'contour' in self.photo_caption:
-            return self.apply_contour_filter()
-        elif 'rotate' in self.photo_caption:
-            return self.apply_rotate_filter()
-        elif 'salt and pepper' in self.photo_caption:
-            return self.apply_salt_n_pepper_filter()
-        elif 'segment' in self.photo_caption:
-            return self.apply_segment_filter()
-        elif 'random color' in self.photo_caption:
-            return self.apply_random_colors_filter()
-        else:
+        filter_chain = self.parse_filter_chain()
+        if not filter_chain:
             return None, "No valid filter found"
+        return self.apply_filter_chain(filter_chain)
 
     def apply_blur_filter(self):
-        return self.apply_filter(Img.blur, 'Blur')
+        return self.apply_filter('blur', 'Blur')
 
     def apply_contour_filter(self):
-        return self.apply_filter(Img.contour, 'Contour')
+        return self.apply_filter('contour', 'Contour')
 
     def apply_rotate_filter(self):
-        return self.apply_filter(Img.rotate, 'Rotate')
+        return self.apply_filter('rotate', 'Rotate')
 
     def apply_salt_n_pepper_filter(self):
-        return self.apply_filter(Img.salt_n_pepper, 'Salt and Pepper')
+        return self.apply_filter('salt_n_pepper', 'Salt and Pepper')
 
     def apply_segment_filter(self):
-        return self.apply_filter(Img.segment, 'Segment')
+        return self.apply_filter('segment', 'Segment')
 
     def apply_random_colors_filter(self):
-        return self.apply_filter(Img.random_colors, 'Random Colors')
+        return self.apply_filter('random_colors', 'Random Colors')
+
+    def apply_filter(self, method_name, filter_name):
+        img_instance = self.load_img()
+        getattr(img_instance, method_name)()  # Call the Img filter method
+        processed_img = self.output_img(img_instance)
+
+        return processed_img, filter_name
+
+    def load_img(self):
+        from img_proc import Img
+        return Img(self.img_path, storage=FILTER_STORAGE, source=self.img_bytes, seed=self.seed,
+                   max_pixels=FILTER_MAX_PIXELS or None)
+
+    def output_img(self, img_instance):
+        """
+        Returns:
+            Path or bytes: Path of the saved image, or the encoded image if the photo was given in memory.
+        """
+        if self.img_bytes is not None:
+            return img_instance.encode_img()
+        return img_instance.save_img()
+
+    def apply_filter_chain(self, filter_chain):
+        """
+        Apply a chain of filters with a single decode and a single encode.
+        Adjacent pointwise filters (e.g. segment then salt and pepper) are fused into one pass.
+
+        Parameters:
+            filter_chain (list): Caption keywords of the filters, in order.
+
+        Returns:
+            processed_img (Path or bytes): Path of the filtered image, or the encoded image (see output_img).
+            filter_name (str): Names of the applied filters.
+        """
+        from img_proc import POINTWISE_FILTERS
+        img_instance = self.load_img()
+
+        pointwise_group = []
+        for keyword in filter_chain:
+            method_name = FILTER_KEYWORDS[keyword][0]
+            if method_name in POINTWISE_FILTERS:
+                pointwise_group.append(method_name)
+                continue
+            if pointwise_group:
+                img_instance.apply_pointwise(pointwise_group)
+                pointwise_group = []
+            getattr(img_instance, method_name)()
+        if pointwise_group:
+            img_instance.apply_pointwise(pointwise_group)
 
-    def apply_filter(self, filter_func, filter_name):
-        img_instance = Img(self.img_path)
-        filter_func(img_instance)  # Call the provided filter function
-        processed_img_path = img_instance.save_img()
+        processed_img = self.output_img(img_instance)
+        filter_name = ' + '.join(FILTER_KEYWORDS[keyword][1] for keyword in filter_chain)
 
-        return processed_img_path, filter_name
+        return processed_img, filter_name
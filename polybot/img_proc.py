@@ -1,7 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from functools import lru_cache
 from pathlib import Path
-from matplotlib.image import imread, imsave
 import math
-import random
+import os
+import threading
+import numpy as np
+
+# Number of threads that filter one image in bands, 1 filters it in one piece
+IMG_WORKERS = int(os.environ.get('IMG_WORKERS', 1))
+# Images with fewer pixels than this are always filtered in one piece
+IMG_BANDS_MIN_PIXELS = int(os.environ.get('IMG_BANDS_MIN_PIXELS', 1_000_000))
+# Format of the encoded images (e.g. 'jpeg', 'png'), empty keeps the format of the original photo
+IMG_ENCODE_FORMAT = os.environ.get('IMG_ENCODE_FORMAT', '')
+# JPEG quality of the encoded images
+IMG_ENCODE_QUALITY = int(os.environ.get('IMG_ENCODE_QUALITY', 90))
+# Number of rotation grids kept, each holds two index arrays of up to 4 bytes per pixel
+ROTATION_CACHE_SIZE = int(os.environ.get('ROTATION_CACHE_SIZE', 4))
+
+# File extension -> Pillow format name, where they differ
+PIL_FORMATS = {'jpg': 'JPEG'}
 
 
 def rgb2gray(rgb):
@@ -10,24 +28,362 @@ def rgb2gray(rgb):
     return gray
 
 
+def downscale_factor(height, width, max_pixels):
+    """
+    Smallest integer factor that brings the image within max_pixels.
+
+    Parameters:
+        height (int): Image height.
+        width (int): Image width.
+        max_pixels (int): Pixel budget, 0 or None for no budget.
+
+    Returns:
+        int: 1 if the image is within the budget.
+    """
+    if not max_pixels or height * width <= max_pixels:
+        return 1
+    factor = max(int(math.sqrt(height * width / max_pixels)), 1)
+    while (height // factor) * (width // factor) > max_pixels:
+        factor += 1
+    return factor
+
+
+def area_downscale(data, factor):
+    """
+    Downscale by averaging every factor x factor block of pixels. The last rows and columns
+    that do not fill a block are dropped.
+
+    Parameters:
+        data (np.ndarray): 2D or 3D (color) image.
+        factor (int): Downscale factor.
+
+    Returns:
+        np.ndarray: float64 image of (height // factor, width // factor) pixels.
+    """
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    blocks = data[:height * factor, :width * factor].reshape(height, factor, width, factor, *data.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+
+def box_sums_in_order(data, rows, cols, blur_level):
+    """
+    Sum the blur_level x blur_level windows whose top-left corners are (rows, cols),
+    adding the pixels in the same order as the list implementation of Img.blur.
+
+    Parameters:
+        data (np.ndarray): 2D float image.
+        rows (np.ndarray): Top row of every window.
+        cols (np.ndarray): Left column of every window.
+        blur_level (int): Window size.
+
+    Returns:
+        np.ndarray: One sum per window.
+    """
+    offsets = np.arange(blur_level)
+    window_rows = rows[:, np.newaxis] + offsets[np.newaxis, :]
+
+    row_sums = np.zeros((len(rows), blur_level))
+    for j in range(blur_level):
+        row_sums += data[window_rows, (cols + j)[:, np.newaxis]]
+
+    total = np.zeros(len(rows))
+    for i in range(blur_level):
+        total += row_sums[:, i]
+    return total
+
+
+def integral_box_blur(data, blur_level, out=None):
+    """
+    Box blur based on a summed-area table, so every output pixel costs four lookups
+    whatever the kernel size. The output matches Img.blur exactly: sums whose floor
+    division could be affected by rounding in the table are recomputed in the
+    original summation order.
+
+    Parameters:
+        data (np.ndarray): 2D float image.
+        blur_level (int): Kernel size.
+        out (np.ndarray): Optional array to write the result into.
+
+    Returns:
+        np.ndarray: Blurred image, cropped by blur_level - 1 pixels on each axis.
+    """
+    height, width = data.shape
+    out_height = max(height - blur_level + 1, 0)
+    out_width = max(width - blur_level + 1, 0)
+    filter_sum = blur_level ** 2
+
+    table = np.zeros((height + 1, width + 1))
+    np.cumsum(data, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+
+    bottom, right = blur_level, blur_level
+    total = (table[bottom:bottom + out_height, right:right + out_width]
+             - table[:out_height, right:right + out_width]
+             - table[bottom:bottom + out_height, :out_width]
+             + table[:out_height, :out_width])
+    result = np.floor_divide(total, filter_sum, out=out)
+
+    # Integer-valued images below 2**53 are summed exactly, so no sum can be off.
+    abs_total = float(np.abs(data).sum()) if data.size else 0.0
+    if abs_total < 2 ** 53 and np.array_equal(data, np.floor(data)):
+        return result
+
+    # Bound of the rounding error of the table lookups and of the in-order sum.
+    tolerance = 4 * (height + width + filter_sum + 4) * np.finfo(np.float64).eps * abs_total
+    remainder = total - result * filter_sum
+    rows, cols = np.nonzero((remainder <= tolerance) | (remainder >= filter_sum - tolerance))
+    if len(rows):
+        result[rows, cols] = np.floor_divide(box_sums_in_order(data, rows, cols, blur_level), filter_sum)
+    return result
+
+
+def contour_pixels(data, out=None):
+    return np.abs(np.subtract(data[:, :-1], data[:, 1:], out=out), out=out)
+
+
+_band_executor = None
+_band_executor_lock = threading.Lock()
+
+
+def get_band_executor():
+    """
+    Thread pool shared by all the images of the process. NumPy releases the GIL
+    in the heavy loops, so the bands of one image run on several cores.
+    """
+    global _band_executor
+    with _band_executor_lock:
+        if _band_executor is None:
+            _band_executor = ThreadPoolExecutor(max_workers=IMG_WORKERS, thread_name_prefix='img-band')
+        return _band_executor
+
+
+def filter_in_bands(band_filter, data, out_shape, halo):
+    """
+    Run a filter on horizontal bands of the image in parallel. Every band is read with
+    `halo` extra rows below it and written straight into its rows of the output, so the
+    result is identical to filtering the whole image at once.
+
+    Parameters:
+        band_filter (callable): Called as band_filter(input_rows, out=output_rows).
+        data (np.ndarray): 2D image.
+        out_shape (tuple): Shape of the filtered image.
+        halo (int): Number of extra input rows every output row depends on.
+
+    Returns:
+        np.ndarray: The filtered image.
+    """
+    out = np.empty(out_shape)
+    band_rows = max(-(-out_shape[0] // IMG_WORKERS), 1)
+    futures = [get_band_executor().submit(band_filter, data[start:start + band_rows + halo],
+                                          out=out[start:start + band_rows])
+               for start in range(0, out_shape[0], band_rows)]
+    for future in futures:
+        future.result()
+    return out
+
+
+@lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def rotation_mapping(height, width, center_x, center_y, degrees):
+    """
+    Inverse-mapping grid of a rotation, cached per image shape and angle so repeated
+    rotations of same-sized photos reuse it. Every pixel is mapped with the same floating
+    point expression and truncation as the list implementation of Img.rotate_by_degree.
+    The indices are int32 when they fit, half the size of intp.
+
+    Parameters:
+        height (int): Image height.
+        width (int): Image width.
+        center_x (float): Rotation center column.
+        center_y (float): Rotation center row.
+        degrees (float): Rotation angle in degrees.
+
+    Returns:
+        target_index (np.ndarray): Flat indices of the output pixels that have a source pixel.
+        source_index (np.ndarray): Flat indices of their source pixels.
+    """
+    radians = math.radians(degrees)
+    cos = math.cos(radians)
+    sin = math.sin(radians)
+
+    dx = np.arange(width, dtype=np.float64)[np.newaxis, :] - center_x
+    dy = np.arange(height, dtype=np.float64)[:, np.newaxis] - center_y
+    new_x = np.trunc(dx * cos - dy * sin + center_x).astype(np.intp)
+    new_y = np.trunc(dx * sin + dy * cos + center_y).astype(np.intp)
+    in_bounds = (new_x >= 0) & (new_x < width) & (new_y >= 0) & (new_y < height)
+
+    index_type = np.int32 if height * width <= np.iinfo(np.int32).max else np.intp
+    target_index = np.flatnonzero(in_bounds).astype(index_type)
+    source_index = (new_y[in_bounds] * width + new_x[in_bounds]).astype(index_type)
+    target_index.flags.writeable = False
+    source_index.flags.writeable = False
+    return target_index, source_index
+
+
+def segment_pixels(values, rng=None):
+    return np.where(values > 100, 255, 0)
+
+
+def salt_n_pepper_pixels(values, rng, salt_prob=0.02, pepper_prob=0.02):
+    rand = rng.random(values.shape)
+    return np.where(rand < salt_prob, 255, np.where(rand > (1 - pepper_prob), 0, values))
+
+
+def random_color_pixels(values, rng):
+    return rng.integers(0, 256, size=values.shape)
+
+
+# Filters whose output pixel depends only on the input pixel at the same position, so adjacent ones
+# can be fused. Each is called with a block of rows and the image's random generator; the noise is
+# drawn in row order, so the result for a seed does not depend on the block size.
+POINTWISE_FILTERS = {
+    'segment': segment_pixels,
+    'salt_n_pepper': salt_n_pepper_pixels,
+    'random_colors': random_color_pixels,
+}
+
+# Pointwise filters that draw from the random generator
+RANDOM_FILTERS = {'salt_n_pepper', 'random_colors'}
+
+# Rows per block when fusing pointwise filters, so a block stays in cache between stages
+POINTWISE_BLOCK_ROWS = 64
+
+
 class Img:
 
-    def __init__(self, path):
+    def __init__(self, path, storage='list', source=None, seed=None, max_pixels=None):
         """
-        Do not change the constructor implementation
+        Load the image and convert it to grayscale.
+
+        Args:
+            path (str): Path to the image file.
+            storage (str): 'list' keeps the pixels as nested Python lists,
+                'numpy' keeps them as a float64 ndarray and uses the vectorized filters,
+                'uint8' keeps the decoded uint8 pixels, in color, and only the filters that
+                need intensities convert them to grayscale.
+            source (bytes): The encoded image, decoded from memory instead of reading path.
+                path then only names the image and its format.
+            seed (int): Seed of the random noise filters, so their output can be reproduced.
+                None seeds them from the OS.
+            max_pixels (int): Pixel budget. Larger images are downscaled by area averaging when
+                they are decoded, before any filter runs. None keeps the full resolution.
         """
+        if storage not in ('list', 'numpy', 'uint8'):
+            raise ValueError("Invalid storage. Use 'list', 'numpy' or 'uint8'.")
+
         self.path = Path(path)
-        self.data = rgb2gray(imread(path)).tolist()
+        self.storage = storage
+        if storage == 'uint8':
+            self.data = self._decode_native(BytesIO(source) if source is not None else path, max_pixels)
+        else:
+            # matplotlib takes a few hundred milliseconds to import, so it is loaded with the first image
+            from matplotlib.image import imread
+            if source is not None:
+                gray = rgb2gray(imread(BytesIO(source), format=self.image_format()))
+            else:
+                gray = rgb2gray(imread(path))
+            factor = downscale_factor(gray.shape[0], gray.shape[1], max_pixels)
+            if factor > 1:
+                gray = area_downscale(gray, factor)
+            if storage == 'numpy':
+                self.data = np.asarray(gray, dtype=np.float64)
+            else:
+                self.data = gray.tolist()
         self.info = self.calculate_image_info()
+        self.rng = np.random.default_rng(seed)
+
+    def is_numpy(self):
+        return self.storage in ('numpy', 'uint8')
+
+    def is_uint8(self):
+        return self.storage == 'uint8'
+
+    def use_bands(self):
+        return self.storage == 'numpy' and IMG_WORKERS > 1 and self.data.size >= IMG_BANDS_MIN_PIXELS
+
+    def _decode_native(self, source, max_pixels=None):
+        """
+        Decode the image with Pillow, keeping its uint8 pixels.
+
+        Args:
+            source (str or BytesIO): Path or buffer of the encoded image.
+            max_pixels (int): Pixel budget, see Img.
+
+        Returns:
+            np.ndarray: (height, width, 3) for color images, (height, width) for grayscale ones.
+        """
+        from PIL import Image
+        with Image.open(source) as image:
+            factor = downscale_factor(image.height, image.width, max_pixels)
+            size = (image.width // factor, image.height // factor)
+            if factor > 1:
+                # JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale when that is still at least size
+                image.draft(image.mode, size)
+            if image.mode not in ('L', 'RGB'):
+                image = image.convert('RGB')
+            if image.size != size:
+                # Area averaging, the same size as area_downscale
+                image = image.resize(size, Image.Resampling.BOX)
+            return np.asarray(image)
+
+    def gray(self):
+        """
+        Grayscale intensities of the image, computed only when a filter needs them.
+
+        Returns:
+            np.ndarray: 2D float image in uint8 storage, the data itself otherwise.
+        """
+        if self.is_uint8() and self.data.ndim == 3:
+            return rgb2gray(self.data)
+        return self.data
+
+    def as_list(self):
+        """
+        Return the pixels as nested Python lists, whatever the storage mode.
+
+        Returns:
+            list: 2D list of pixel values.
+        """
+        if self.is_numpy():
+            return self.data.tolist()
+        return self.data
 
     def save_img(self):
         """
         Do not change the below implementation
         """
+        from matplotlib.image import imsave
         new_path = self.path.with_name(self.path.stem + '_filtered' + self.path.suffix)
         imsave(new_path, self.data, cmap='gray')
         return new_path
 
+    def image_format(self):
+        return self.path.suffix.lstrip('.').lower() or 'png'
+
+    def encode_img(self, image_format=None, quality=None):
+        """
+        Encode the image without writing it to disk. uint8 storage is encoded by Pillow as is,
+        the other storages go through matplotlib's gray colormap like save_img.
+
+        Args:
+            image_format (str): e.g. 'jpeg' or 'png'. Defaults to IMG_ENCODE_FORMAT, then to the format of the path.
+            quality (int): JPEG quality. Defaults to IMG_ENCODE_QUALITY.
+
+        Returns:
+            bytes: The encoded image.
+        """
+        image_format = (image_format or IMG_ENCODE_FORMAT or self.image_format()).lower()
+        pil_format = PIL_FORMATS.get(image_format, image_format.upper())
+        pil_kwargs = {'quality': quality or IMG_ENCODE_QUALITY} if pil_format == 'JPEG' else {}
+
+        buffer = BytesIO()
+        if self.is_uint8():
+            from PIL import Image
+            Image.fromarray(self.data).save(buffer, format=pil_format, **pil_kwargs)
+        else:
+            from matplotlib.image import imsave
+            imsave(buffer, self.data, cmap='gray', format=image_format, pil_kwargs=pil_kwargs or None)
+        return buffer.getvalue()
+
     def calculate_image_info(self):
         """
         Calculate image dimensions and center.
@@ -38,7 +394,7 @@ class Img:
         width = len(self.data[0])
         height = len(self.data)
 
-        if self.data[0][0] < 1:
+        if np.min(self.data[0][0]) < 1:
             center_x = (width - 1) / 2
             center_y = (height - 1) / 2
         else:
@@ -52,7 +408,31 @@ class Img:
             'center_y': center_y
         }
 
-    def blur(self, blur_level=16):
+    def blur(self, blur_level=16, engine='integral'):
+        """
+        Blur the image with a blur_level x blur_level box filter.
+
+        Args:
+            blur_level (int): Kernel size.
+            engine (str): Numpy storage only. 'integral' uses a summed-area table,
+                'direct' sums every window.
+        """
+        if self.is_uint8():
+            self.data = self._channels(lambda channel: integral_box_blur(channel, blur_level))
+            return
+
+        if self.is_numpy():
+            if engine == 'integral' and self.use_bands():
+                out_shape = (max(len(self.data) - blur_level + 1, 0), max(len(self.data[0]) - blur_level + 1, 0))
+                self.data = filter_in_bands(lambda band, out: integral_box_blur(band, blur_level, out=out),
+                                            self.data, out_shape, halo=blur_level - 1)
+            elif engine == 'integral':
+                self.data = integral_box_blur(self.data, blur_level)
+            elif engine == 'direct':
+                self.data = self._blur_array(blur_level)
+            else:
+                raise ValueError("Invalid blur engine. Use 'integral' or 'direct'.")
+            return
 
         image_info = self.calculate_image_info()
         width = image_info['width']
@@ -70,7 +450,43 @@ class Img:
 
         self.data = result
 
+    def _blur_array(self, blur_level):
+        """
+        Vectorized box blur that sums in the same order as the list implementation
+        (each row left to right, then the row sums top to bottom), so the result is bit-identical.
+
+        Args:
+            blur_level (int): Kernel size.
+
+        Returns:
+            np.ndarray: Blurred image, cropped by blur_level - 1 pixels on each axis.
+        """
+        height, width = self.data.shape
+        out_height = max(height - blur_level + 1, 0)
+        out_width = max(width - blur_level + 1, 0)
+
+        row_sums = np.zeros((height, out_width))
+        for j in range(blur_level):
+            row_sums += self.data[:, j:j + out_width]
+
+        total = np.zeros((out_height, out_width))
+        for i in range(blur_level):
+            total += row_sums[i:i + out_height]
+
+        return np.floor_divide(total, blur_level ** 2)
+
     def contour(self):
+        if self.use_bands():
+            self.data = filter_in_bands(contour_pixels, self.data,
+                                        (len(self.data), len(self.data[0]) - 1), halo=0)
+            return
+        if self.is_uint8():
+            self.data = self._channels(contour_pixels)
+            return
+        if self.is_numpy():
+            self.data = contour_pixels(self.data)
+            return
+
         for i, row in enumerate(self.data):
             res = []
             for j in range(1, len(row)):
@@ -78,6 +494,23 @@ class Img:
 
             self.data[i] = res
 
+    def _channels(self, channel_filter):
+        """
+        Run a 2D filter on every channel of a uint8 image.
+
+        Args:
+            channel_filter (callable): Called with one channel as a float64 array.
+
+        Returns:
+            np.ndarray: The filtered uint8 image.
+        """
+        if self.data.ndim == 2:
+            return channel_filter(self.data.astype(np.float64)).astype(np.uint8)
+        # One float channel at a time, back to uint8 right away
+        channels = [channel_filter(self.data[:, :, c].astype(np.float64)).astype(np.uint8)
+                    for c in range(self.data.shape[2])]
+        return np.stack(channels, axis=-1)
+
     def rotate(self):
         """
         Rotate the image by 90 degrees.
@@ -85,38 +518,7 @@ class Img:
         Returns:
             Img: Rotated image object.
         """
-        # 1. Import the data from the basic_calculations function
-        image_info = self.calculate_image_info()
-        width = image_info['width']
-        height = image_info['height']
-        center_x = image_info['center_x']
-        center_y = image_info['center_y']
-        degrees = 90
-
-        # 2. Calculate degrees in radiants
-        radians = math.radians(degrees)
-
-        # 3. Create new variable to store the new rotated image
-        rotated_image = [[0] * width for _ in range(height)]
-
-        # 4. Iterate over each pixel in the original image
-        for y in range(height):
-            for x in range(width):
-
-                # 5. Calculate for each pixel its new location
-                new_x = int((x - center_x) * math.cos(radians) - (y - center_y) * math.sin(radians) + center_x)
-                new_y = int((x - center_x) * math.sin(radians) + (y - center_y) * math.cos(radians) + center_y)
-
-                # 6. Check if new coordinates are within bounds
-                if 0 <= new_x < width and 0 <= new_y < height:
-                    # 7. Copy the pixel value to the rotated position
-                    rotated_image[y][x] = self.data[new_y][new_x]
-
-        # 8. Set the rotated data back to the instance
-        self.data = rotated_image
-
-        # 9. Display Result (optional, you might not want to return anything)
-        return self
+        return self.rotate_by_degree(90)
 
     def salt_n_pepper(self, salt_prob=0.02, pepper_prob=0.02):
         """
@@ -126,14 +528,64 @@ class Img:
             salt_prob (float): Probability of adding salt noise.
             pepper_prob (float): Probability of adding pepper noise.
         """
+        noise_rng = self.rng.spawn(1)[0]
+        if self.is_uint8():
+            # One draw per pixel, the noise is white or black on all the channels
+            rand = noise_rng.random(self.data.shape[:2])
+            if self.data.ndim == 3:
+                rand = rand[:, :, np.newaxis]
+            self.data = np.where(rand < salt_prob, 255,
+                                 np.where(rand > (1 - pepper_prob), 0, self.data)).astype(np.uint8)
+            return
+        if self.is_numpy():
+            self.data = salt_n_pepper_pixels(self.data, noise_rng, salt_prob, pepper_prob)
+            return
+
+        # The noise mask is drawn in bulk, the same one as in numpy storage
+        rand = noise_rng.random((len(self.data), len(self.data[0]))).tolist()
         for i in range(len(self.data)):
             for j in range(len(self.data[i])):
-                rand = random.random()
-                if rand < salt_prob:
+                if rand[i][j] < salt_prob:
                     self.data[i][j] = 255  # White pixel for salt noise
-                elif rand > (1 - pepper_prob):
+                elif rand[i][j] > (1 - pepper_prob):
                     self.data[i][j] = 0  # Black pixel for pepper noise
 
+    def apply_pointwise(self, filter_names):
+        """
+        Apply several pointwise filters (see POINTWISE_FILTERS) in a single pass over the image.
+        Each random filter gets its own generator spawned from the image's, so the result is the same
+        as applying the filters one by one.
+
+        Args:
+            filter_names (list): Names of the filters, in the order to apply them.
+        """
+        if self.is_uint8():
+            # uint8 arrays are small enough to apply the filters one by one
+            for name in filter_names:
+                getattr(self, name)()
+            return
+
+        block_filters = [POINTWISE_FILTERS[name] for name in filter_names]
+        rngs = [self.rng.spawn(1)[0] if name in RANDOM_FILTERS else None for name in filter_names]
+
+        if not self.is_numpy():
+            data = np.asarray(self.data)
+            for block_filter, rng in zip(block_filters, rngs):
+                data = block_filter(data, rng)
+            self.data = data.tolist()
+            return
+
+        result = None
+        for start in range(0, len(self.data), POINTWISE_BLOCK_ROWS):
+            block = self.data[start:start + POINTWISE_BLOCK_ROWS]
+            for block_filter, rng in zip(block_filters, rngs):
+                block = block_filter(block, rng)
+            if result is None:
+                result = np.empty(self.data.shape, dtype=block.dtype)
+            result[start:start + POINTWISE_BLOCK_ROWS] = block
+        if result is not None:
+            self.data = result
+
     def concat(self, other_img, direction='horizontal'):
         """
         Concatenate the current image with another image.
@@ -164,13 +616,19 @@ class Img:
                 raise RuntimeError(
                     "Image dimensions are not compatible for horizontal concatenation. Heights must be the same.")
             else:
-                self.data = [row_self + row_other for row_self, row_other in zip(self.data, other_data)]
+                if self.is_numpy():
+                    self.data = np.hstack((self.data, np.asarray(other_data)))
+                else:
+                    self.data = [row_self + row_other for row_self, row_other in zip(self.data, other_data)]
         elif direction == 'vertical':
             if self_width != other_width:
                 raise RuntimeError(
                     "Image dimensions are not compatible for vertical concatenation. Widths must be the same.")
             else:
-                self.data += other_data
+                if self.is_numpy():
+                    self.data = np.vstack((self.data, np.asarray(other_data)))
+                else:
+                    self.data += other_data
         else:
             raise ValueError("Invalid concatenation direction. Use 'horizontal' or 'vertical'.")
 
@@ -182,8 +640,15 @@ class Img:
         Segment images (black and white).
 
         Returns:
-            list: 2D list representing the segmented image.
+            list: 2D list representing the segmented image (an ndarray in numpy storage).
         """
+        if self.is_uint8():
+            self.data = segment_pixels(self.gray()).astype(np.uint8)
+            return self.data
+
+        if self.is_numpy():
+            self.data = segment_pixels(self.data)
+            return self.data
 
         # 1. Import the data from the basic_calculations function
         image_info = self.calculate_image_info()
@@ -216,6 +681,15 @@ class Img:
         Returns:
             Img: Rotated image object.
         """
+        # Multiples of 90 degrees are an exact transpose/flip, no trigonometry or cropping needed
+        if degrees % 90 == 0:
+            self.data = self._rotate_quarter_turns(int(degrees // 90) % 4)
+            return self
+
+        if self.is_numpy():
+            self.data = self._rotate_array(degrees)
+            return self
+
         # 1. Import the data from the basic_calculations function
         image_info = self.calculate_image_info()
         width = image_info['width']
@@ -248,21 +722,71 @@ class Img:
         # 9. Display Result (optional, you might not want to return anything)
         return self
 
+    def _rotate_quarter_turns(self, turns):
+        """
+        Rotate the image counterclockwise by a number of quarter turns by remapping indices.
+        Width and height are swapped for odd turns, so nothing is cropped.
+
+        Args:
+            turns (int): Number of quarter turns, between 0 and 3.
+
+        Returns:
+            Rotated pixels (a view of the data in numpy storage).
+        """
+        if self.is_numpy():
+            return np.rot90(self.data, turns)
+
+        if turns == 1:
+            return [list(column) for column in zip(*self.data)][::-1]
+        elif turns == 2:
+            return [row[::-1] for row in self.data[::-1]]
+        elif turns == 3:
+            return [list(column)[::-1] for column in zip(*self.data)]
+        return self.data
+
+    def _rotate_array(self, degrees):
+        """
+        Vectorized version of the rotation loop, using a cached inverse-mapping grid.
+
+        Args:
+            degrees (float): Rotation angle in degrees.
+
+        Returns:
+            np.ndarray: Rotated image with the same width and height.
+        """
+        image_info = self.calculate_image_info()
+        target_index, source_index = rotation_mapping(image_info['height'], image_info['width'],
+                                                      image_info['center_x'], image_info['center_y'], degrees)
+
+        # Color pixels are moved with all their channels
+        pixels = self.data.reshape(image_info['height'] * image_info['width'], -1)
+        rotated_image = np.zeros_like(pixels)
+        rotated_image[target_index] = pixels[source_index]
+        return rotated_image.reshape(self.data.shape)
+
     def random_colors(self):
         """
         Apply the 'random colors' filter to the image.
         Assigns a random RGB color to each pixel.
         """
+        noise_rng = self.rng.spawn(1)[0]
+        if self.is_uint8():
+            # A color per pixel for color images
+            self.data = noise_rng.integers(0, 256, size=self.data.shape, dtype=np.uint8)
+            return
+        if self.is_numpy():
+            self.data = random_color_pixels(self.data, noise_rng)
+            return
 
         # Calculate the image information for the current instance
         self_info = self.calculate_image_info()
         height = self_info['height']
         width = self_info['width']
 
+        # Generate random RGB values in bulk, the same ones as in numpy storage
+        colors = noise_rng.integers(0, 256, size=(height, width)).tolist()
+
         for i in range(height):
             for j in range(width):
-                # Generate random RGB values
-                color = random.randint(0, 255)
-
                 # Set the pixel color
-                self.data[i][j] = color
+                self.data[i][j] = colors[i][j]
@@ -0,0 +1,83 @@
+import re
+
+
+class IntentMatcher:
+    """
+    Classifies a message with one pass of a single compiled regex over its text.
+
+    All the keywords of the intents and all the filter keywords are literal alternatives of the
+    regex, longest first. "words" of an intent must also be a whole whitespace-separated word,
+    which is only checked when the regex found them. "phrases" match anywhere.
+    Intents are checked in the order they are listed; an intent with "requires_filter" also needs
+    a filter keyword in the text.
+    """
+
+    def __init__(self, intents, filter_keywords):
+        """
+        Parameters:
+            intents (list): Intents from responses.json, by priority.
+            filter_keywords (dict): Filter keyword -> key of its info response in responses.json.
+        """
+        self.intents = intents
+        self.filter_keywords = filter_keywords
+
+        # keyword -> ('intent', name) or ('filter', keyword)
+        self.owners = {}
+        self.words = set()
+        for intent in intents:
+            for word in intent.get('words', []):
+                self.owners[word] = ('intent', intent['name'])
+                self.words.add(word)
+            for phrase in intent.get('phrases', []):
+                self.owners[phrase] = ('intent', intent['name'])
+        for keyword in filter_keywords:
+            self.owners[keyword] = ('filter', keyword)
+
+        # Literal alternatives only, so the regex engine can skip quickly over positions that match nothing
+        keywords = sorted(self.owners, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+    def scan(self, text):
+        """
+        Returns:
+            found_intents (set): Names of the intents whose keywords are in the text.
+            found_filters (set): Filter keywords in the text.
+        """
+        text = text.lower()
+        found = {'intent': set(), 'filter': set()}
+        tokens = None
+        for keyword in set(self.pattern.findall(text)):
+            if keyword in self.words:
+                tokens = tokens if tokens is not None else set(text.split())
+                if keyword not in tokens:
+                    continue
+            kind, value = self.owners[keyword]
+            found[kind].add(value)
+        return found['intent'], found['filter']
+
+    def filters_in(self, text):
+        """
+        Returns:
+            found_filters (set): Filter keywords in the text.
+        """
+        return self.scan(text)[1]
+
+    def classify(self, text):
+        """
+        Parameters:
+            text (str): The message text.
+
+        Returns:
+            intent (str): Name of the intent, 'filter_reminder' if only a filter is mentioned, or 'default'.
+            mentioned_filter (str): The first filter keyword (in responses.json order) in the text, or None.
+        """
+        found_intents, found_filters = self.scan(text)
+        mentioned_filter = next((keyword for keyword in self.filter_keywords if keyword in found_filters), None)
+
+        for intent in self.intents:
+            if intent['name'] in found_intents and (mentioned_filter or not intent.get('requires_filter')):
+                return intent['name'], mentioned_filter
+
+        if mentioned_filter:
+            return 'filter_reminder', mentioned_filter
+        return 'default', None
@@ -0,0 +1,21 @@
+from prometheus_client import Counter, Gauge
+
+FILTER_CACHE_HITS = Counter(
+    'polybot_filter_cache_hits_total',
+    'Filter requests answered by re-sending an already filtered photo',
+)
+
+FILTER_CACHE_MISSES = Counter(
+    'polybot_filter_cache_misses_total',
+    'Cacheable filter requests that had to download and filter the photo',
+)
+
+FILTER_CACHE_STALE = Counter(
+    'polybot_filter_cache_stale_total',
+    'Cached photos whose re-send failed, so they were evicted and filtered again',
+)
+
+FILTER_CACHE_ENTRIES = Gauge(
+    'polybot_filter_cache_entries',
+    'Number of filtered photos in the result cache',
+)
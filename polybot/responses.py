@@ -11,7 +11,11 @@ options- are static).
 "default"- The default message when the user's input is not recognize.
 "photo_errors" ("no_cation")- The user sent a photo but with no captions.
 "photo_errors" ("permissions_error")- The user sent a message but can't be edited due to permissions error.
+"photo_errors" ("queue_full")- The user sent a photo while all the filter workers are busy.
 "help"- explanation about the bot.
+"intents"- the keywords of every text intent, by priority (see intents.py). "words" match whole words,
+"phrases" match anywhere, "requires_filter" intents also need a filter keyword.
+"filter_keywords"- the filter keywords and the key of their "_info" response.
 
 """
 
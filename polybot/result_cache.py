@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import os
+import threading
+from loguru import logger
+from metrics import FILTER_CACHE_HITS, FILTER_CACHE_MISSES, FILTER_CACHE_STALE, FILTER_CACHE_ENTRIES
+
+# Number of filtered photos remembered, 0 disables the cache
+FILTER_CACHE_SIZE = int(os.environ.get('FILTER_CACHE_SIZE', 4096))
+# Log the hit rate every this many lookups
+FILTER_CACHE_LOG_EVERY = int(os.environ.get('FILTER_CACHE_LOG_EVERY', 100))
+
+
+class FilteredPhotoCache:
+    """
+    Telegram file_id of the photos the bot already sent, keyed on the Telegram file_unique_id of
+    the original photo and the normalized filter chain. A repeated request is answered by re-sending
+    the file_id, without downloading, filtering or uploading anything. Bounded LRU in memory.
+    """
+
+    def __init__(self, max_entries=FILTER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Look up a filtered photo. A miss is counted here, a hit only once the photo was re-sent
+        (see record_hit and evict).
+
+        Parameters:
+            key (tuple): See Filters.cache_key.
+
+        Returns:
+            file_id (str): Telegram file_id of the filtered photo, or None.
+            filter_name (str): Names of the applied filters, or None.
+        """
+        if not self.max_entries:
+            return None, None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        self._count(hit=False)
+        return None, None
+
+    def __contains__(self, key):
+        # Membership only, not counted as a lookup
+        with self.lock:
+            return key in self.entries
+
+    def record_hit(self):
+        """Count a photo from the cache that was re-sent."""
+        self._count(hit=True)
+
+    def evict(self, key):
+        """
+        Drop a photo whose re-send failed (e.g. an expired file_id). It is filtered again, so it counts as a miss.
+
+        Parameters:
+            key (tuple): See Filters.cache_key.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            FILTER_CACHE_ENTRIES.set(len(self.entries))
+        FILTER_CACHE_STALE.inc()
+        self._count(hit=False)
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+                FILTER_CACHE_HITS.inc()
+            else:
+                self.misses += 1
+                FILTER_CACHE_MISSES.inc()
+            lookups = self.hits + self.misses
+
+        if FILTER_CACHE_LOG_EVERY and lookups % FILTER_CACHE_LOG_EVERY == 0:
+            logger.info(f'Filter cache hit rate {self.hit_rate():.1%} over {lookups} lookups')
+
+    def put(self, key, file_id, filter_name):
+        if not self.max_entries:
+            return
+        with self.lock:
+            self.entries[key] = (file_id, filter_name)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            FILTER_CACHE_ENTRIES.set(len(self.entries))
+
+    def hit_rate(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return self.hits / lookups if lookups else 0.0
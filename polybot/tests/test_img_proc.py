@@ -0,0 +1,129 @@
+"""
+Exactness tests of the vectorized filters against the list implementation of Img. Run from the repository root:
+
+    python -m pytest polybot/tests
+"""
+import os
+import sys
+from io import BytesIO
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import img_proc
+from img_proc import Img, integral_box_blur
+
+
+def photo_bytes(height, width, seed=0):
+    """Random RGB PNG, its grayscale intensities are not integers."""
+    from PIL import Image
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def load(storage, height=24, width=40, seed=None):
+    return Img('photo.png', storage=storage, source=photo_bytes(height, width), seed=seed)
+
+
+def as_list(img):
+    return np.asarray(img.data).tolist()
+
+
+@pytest.fixture
+def bands(monkeypatch):
+    # Every numpy image is filtered in bands by 4 threads
+    monkeypatch.setattr(img_proc, 'IMG_WORKERS', 4)
+    monkeypatch.setattr(img_proc, 'IMG_BANDS_MIN_PIXELS', 0)
+    monkeypatch.setattr(img_proc, '_band_executor', None)
+    yield
+    img_proc.get_band_executor().shutdown()
+
+
+def test_gray_data_is_not_integer():
+    data = load('numpy').data
+    assert not np.array_equal(data, np.floor(data))
+
+
+@pytest.mark.parametrize('blur_level', [1, 2, 3, 7, 16, 24, 30, 41])
+def test_integral_box_blur_matches_list_and_direct(blur_level):
+    list_img = load('list')
+    list_img.blur(blur_level)
+    direct_img = load('numpy')
+    direct_img.blur(blur_level, engine='direct')
+    numpy_data = load('numpy').data
+
+    integral = integral_box_blur(numpy_data, blur_level)
+
+    assert integral.tolist() == as_list(direct_img)
+    assert integral.tolist() == as_list(list_img)
+
+
+def test_integral_box_blur_of_large_values():
+    # Large offsets make the table lookups round, the sums close to a multiple are recomputed in order
+    img = load('numpy')
+    img.data = img.data * 1e6 + 2 ** 40
+    expected = img._blur_array(5)
+
+    assert integral_box_blur(img.data, 5).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('blur_level', [1, 5, 16])
+def test_blur_in_bands_is_identical(bands, blur_level):
+    whole = integral_box_blur(load('numpy', 101, 67).data, blur_level)
+    img = load('numpy', 101, 67)
+    assert img.use_bands()
+
+    img.blur(blur_level)
+
+    assert img.data.tobytes() == whole.tobytes()
+
+
+def test_contour_in_bands_is_identical(bands):
+    whole = img_proc.contour_pixels(load('numpy', 101, 67).data)
+    img = load('numpy', 101, 67)
+
+    img.contour()
+
+    assert img.data.tobytes() == whole.tobytes()
+
+
+@pytest.mark.parametrize('filter_names', [
+    ['salt_n_pepper'],
+    ['random_colors'],
+    ['segment', 'salt_n_pepper'],
+    ['salt_n_pepper', 'segment', 'salt_n_pepper'],
+    ['random_colors', 'salt_n_pepper'],
+])
+@pytest.mark.parametrize('storage', ['list', 'numpy'])
+def test_fused_pointwise_filters_match_one_by_one(monkeypatch, storage, filter_names):
+    # Several blocks per image, each of an odd number of pixels
+    monkeypatch.setattr(img_proc, 'POINTWISE_BLOCK_ROWS', 7)
+    fused = load(storage, 45, 33, seed=3)
+    fused.apply_pointwise(filter_names)
+    one_by_one = load(storage, 45, 33, seed=3)
+    for name in filter_names:
+        getattr(one_by_one, name)()
+
+    assert as_list(fused) == as_list(one_by_one)
+
+
+@pytest.mark.parametrize('filter_names', [['salt_n_pepper'], ['random_colors'], ['segment', 'salt_n_pepper']])
+def test_seeded_noise_is_the_same_in_list_and_numpy(filter_names):
+    list_img = load('list', seed=7)
+    list_img.apply_pointwise(filter_names)
+    numpy_img = load('numpy', seed=7)
+    numpy_img.apply_pointwise(filter_names)
+
+    assert as_list(list_img) == as_list(numpy_img)
+
+
+def test_seed_reproduces_the_noise():
+    first, second, other = load('numpy', seed=11), load('numpy', seed=11), load('numpy', seed=12)
+    for img in (first, second, other):
+        img.salt_n_pepper()
+
+    assert np.array_equal(first.data, second.data)
+    assert not np.array_equal(first.data, other.data)
@@ -0,0 +1,63 @@
+"""
+S3 client tests against moto's in-memory S3 (pip install pytest moto). Run from the repository root:
+
+    python -m pytest polybot/tests
+"""
+import os
+import sys
+import pytest
+
+os.environ.setdefault('BUCKET_NAME', 'polybot-test-images')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+# Appended, not prepended: polybot/responses.py must not shadow the `responses` package moto uses
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from moto import mock_aws
+import detect_filters
+import s3_client
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        # Every test starts without the process-wide client and directory cache
+        s3_client._s3_client = None
+        detect_filters._existing_directories.clear()
+        client = s3_client.get_s3_client()
+        client.create_bucket(Bucket=detect_filters.images_bucket)
+        yield client
+        s3_client._s3_client = None
+
+
+def test_get_s3_client_is_shared(s3):
+    assert s3_client.get_s3_client() is s3
+    assert s3.meta.config.max_pool_connections == s3_client.S3_MAX_POOL_CONNECTIONS
+
+
+def test_upload_photo_to_s3(s3, tmp_path):
+    photo_path = tmp_path / 'photo.jpg'
+    photo_path.write_bytes(b'not really a jpeg')
+
+    s3_key = detect_filters.Detect_Filters(str(photo_path)).upload_photo_to_s3(str(photo_path))
+
+    assert s3_key == 'photos/photo.jpg'
+    body = s3.get_object(Bucket=detect_filters.images_bucket, Key=s3_key)['Body'].read()
+    assert body == b'not really a jpeg'
+    for directory in ('photos/', 'predicted_photos/', 'json/'):
+        s3.head_object(Bucket=detect_filters.images_bucket, Key=directory)
+
+
+def test_upload_checks_directories_once(s3, tmp_path):
+    photo_path = tmp_path / 'photo.jpg'
+    photo_path.write_bytes(b'photo')
+    detect = detect_filters.Detect_Filters(str(photo_path))
+    detect.upload_photo_to_s3(str(photo_path))
+
+    calls = []
+    s3.meta.events.register('before-call.s3', lambda model, **kwargs: calls.append(model.name))
+    detect.upload_photo_to_s3(str(photo_path))
+
+    assert calls == ['PutObject']
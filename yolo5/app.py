@@ -1,24 +1,46 @@
+import io
+import threading
 import time
-from pathlib import Path
-from flask import request, Flask, jsonify
-from detect import run
+from flask import request, Flask, jsonify, Response
+import cv2
+import numpy as np
+from detector import Detector
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, content_hash
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import uuid
 import yaml
 from loguru import logger
 import os
-import boto3
 import json
-from pymongo import MongoClient
 from bson import ObjectId
+from s3_client import get_s3_client, get_transfer_config, get_upload_executor
+from jobs import JobQueue, QueueFullError, CallbackNotAllowedError
+from mongo_writer import get_mongo_client, WriteBehindQueue
 
 images_bucket = os.environ['BUCKET_NAME']
-primary_mongo_name = os.environ['mongo_primary_container_name']
 
 with open("data/coco128.yaml", "r") as stream:
     names = yaml.safe_load(stream)['names']
 
 app = Flask(__name__)
 
+weights = 'yolov5s.pt'
+
+# Loaded once at startup, every request reuses the warmed up model
+detector = Detector(weights=weights, data='data/coco128.yaml')
+# Concurrent requests share forward passes
+batcher = MicroBatcher(detector)
+# One weights reload at a time
+reload_lock = threading.Lock()
+
+# One pooled MongoDB client for the process, summaries are inserted in the background
+prediction_collection = get_mongo_client()['mydatabase']['prediction']
+summary_writer = WriteBehindQueue(prediction_collection)
+
+# Images that were already predicted with the same weights are answered from the cache
+prediction_cache = PredictionCache(prediction_collection, model_version=detector.model_version)
+
 
 def convert_objectid(data):
     if isinstance(data, dict):
@@ -30,51 +52,111 @@ def convert_objectid(data):
     else:
         return data
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    # Call after replacing the weights file: the new weights are loaded, and predictions are cached
+    # under their version from then on, so predictions of the old model are not served
+    global detector
+    with reload_lock:
+        new_detector = Detector(weights=weights, data='data/coco128.yaml')
+        batcher.swap_detector(new_detector)
+        detector = new_detector
+        prediction_cache.invalidate(model_version=new_detector.model_version)
+    return jsonify({"model_version": prediction_cache.model_version})
+
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    # Receives a URL parameter representing the image to download from S3
+    img_name = request.args.get('imgName')
+
+    if img_name is None:
+        logger.error("Missing 'imgName' parameter in the request")
+        return jsonify({"error": "Missing 'imgName' parameter"}), 400
+
+    # Only upload the annotated image when it is requested (the default)
+    annotate = request.args.get('annotate', 'true').lower() != 'false'
+
+    # With async=true or a callbackUrl the prediction runs in the background, and the result
+    # can be polled at /predict/<job_id> or is posted to the callback URL.
+    # The callback URL is only read from the JSON body, so it never shows in the access log.
+    callback_url = (request.get_json(silent=True) or {}).get('callbackUrl')
+    if callback_url or request.args.get('async', 'false').lower() == 'true':
+        try:
+            job_id = prediction_jobs.submit(callback_url=callback_url, img_name=img_name, annotate=annotate)
+        except CallbackNotAllowedError:
+            logger.warning(f'Callback URL is not allowed, rejecting {img_name}')
+            return jsonify({"error": "callbackUrl is not allowed"}), 400
+        except QueueFullError:
+            logger.warning(f'Prediction queue is full, rejecting {img_name}')
+            return jsonify({"error": "Prediction queue is full"}), 503
+        logger.info(f'prediction job: {job_id}. queued {img_name}')
+        return jsonify({"job_id": job_id, "status": "queued"}), 202, {'Location': f'/predict/{job_id}'}
+
+    return run_prediction(img_name, annotate)
+
+
+@app.route('/predict/<job_id>', methods=['GET'])
+def prediction_job(job_id):
+    job = prediction_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+
+def run_prediction(img_name, annotate=True):
+    """
+    Predict the objects in an image stored in S3.
+
+    Parameters:
+        img_name (str): S3 key of the image.
+        annotate (bool): Whether to upload the annotated image.
+
+    Returns:
+        The prediction summary, or an error body and status code.
+    """
     # Generates a UUID for this current prediction HTTP request. This id can be used as a reference in logs to identify
     # and track individual prediction requests.
     prediction_id = str(uuid.uuid4())
 
     logger.info(f'prediction: {prediction_id}. start processing')
 
-    # Receives a URL parameter representing the image to download from S3
-    img_name = request.args.get('imgName')
+    # Stream the original pic from S3 into memory
 
-    if img_name is None:
-        logger.error("Missing 'imgName' parameter in the request")
-        return jsonify({"error": "Missing 'imgName' parameter"}), 400
+    # Shared S3 client of the process
+    s3 = get_s3_client()
+    # The S3 key doubles as the image path in the prediction summary
+    original_img_path = img_name
+    img_buffer = io.BytesIO()
+    s3.download_fileobj(images_bucket, img_name, img_buffer, Config=get_transfer_config())
+    img_bytes = img_buffer.getvalue()
 
-    # Download the original pic from S3
+    # Same image bytes and same weights, same prediction
+    image_hash = content_hash(img_bytes)
+    cached_summary = prediction_cache.get(image_hash, annotated=annotate)
+    if cached_summary is not None:
+        logger.info(f'prediction: {prediction_id}/{original_img_path}. answered from cache ({image_hash})')
+        return convert_objectid(cached_summary)
 
-    # Create an S3 client
-    s3 = boto3.client('s3')
-    # Define the local filename to save the downloaded file
-    file_name = img_name.split('/')[-1]
-    # Expand the $HOME variable to the user's home directory
-    home_dir = os.path.expanduser('~')
-    # Define the full path to the file
-    original_img_path = os.path.join(home_dir, file_name)
-    # Download the file
-    s3.download_file(images_bucket, img_name, original_img_path)
+    original_img = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    if original_img is None:
+        logger.error(f'prediction: {prediction_id}/{original_img_path}. Could not decode the image')
+        return {"error": "Could not decode the image"}, 400
 
     logger.info(f'prediction: {prediction_id}/{original_img_path}. Download img completed')
 
     # Predicts the objects in the image
-    run(
-        weights='yolov5s.pt',
-        data='data/coco128.yaml',
-        source=original_img_path,
-        project='static/data',
-        name=prediction_id,
-        save_txt=True
-    )
+    detections, model_version = batcher.detect(original_img)
+    labels = detector.labels(detections, original_img.shape, names)
 
     logger.info(f'prediction: {prediction_id}{original_img_path}. done')
 
-
-    predicted_img_path = f'static/data/{prediction_id}/{os.path.basename(original_img_path)}'
-
     # Combine the base name and the file extension
     base_name, file_extension = os.path.splitext(os.path.basename(original_img_path))
     new_file_name = f"{base_name}-predict{file_extension}"
@@ -83,31 +165,23 @@ def predict():
     s3_predicted_directory_path = 'predicted_photos/'
 
     # full name in S3
-    full_name_s3=s3_predicted_directory_path + new_file_name
-
-
-    # Upload the predicted image to S3
-    s3.upload_file(predicted_img_path, images_bucket, full_name_s3)
-
-    logger.info(f'prediction: {new_file_name}. was upload to s3 successfully')
-
-    # Parse prediction labels and create a summary
-    pred_summary_path = Path(f'static/data/{prediction_id}/labels/{original_img_path.split("/")[-1].split(".")[0]}.txt')
-
-    logger.info(f'pred_summary_path = {pred_summary_path}')
-
-    if pred_summary_path.exists():
-        with open(pred_summary_path) as f:
-            labels = f.read().splitlines()
-            labels = [line.split(' ') for line in labels]
-            labels = [{
-                'class': names[int(l[0])],
-                'cx': float(l[1]),
-                'cy': float(l[2]),
-                'width': float(l[3]),
-                'height': float(l[4]),
-            } for l in labels]
-
+    full_name_s3 = s3_predicted_directory_path + new_file_name
+
+    # The annotated image and the JSON summary are uploaded at the same time
+    uploads = []
+
+    predicted_img_path = None
+    if annotate:
+        # Encode the annotated image in memory and upload it to S3
+        _, predicted_img = cv2.imencode(file_extension or '.jpg',
+                                        detector.annotate(original_img, detections, names))
+        uploads.append(get_upload_executor().submit(
+            s3.upload_fileobj, io.BytesIO(predicted_img.tobytes()), images_bucket, full_name_s3,
+            Config=get_transfer_config()))
+        predicted_img_path = full_name_s3
+
+    # Nothing detected (detect.run() wrote no labels file in that case)
+    if labels:
         logger.info(f'prediction: {prediction_id}/{original_img_path}. prediction summary:\n\n{labels}')
 
         prediction_summary = {
@@ -115,64 +189,48 @@ def predict():
             'original_img_path': original_img_path,
             'predicted_img_path': predicted_img_path,
             'labels': labels,
-            'time': time.time()
+            'time': time.time(),
+            'image_hash': image_hash,
+            'model_version': model_version
         }
 
-        # Define the path where you want to save the JSON file
-        json_file_path = f'{base_name}.json'
-
-        # Write the prediction summary to a JSON file
-        with open(json_file_path, 'w') as json_file:
-            json.dump(prediction_summary, json_file)
-
-        logger.info(f'json_file_path: {json_file_path}')
-
-        # Upload json file to S3
+        # Upload the json summary to S3 straight from memory
         json_folder_path = "json"
-        json_full_path = f'{json_folder_path}/{json_file_path}'
+        json_full_path = f'{json_folder_path}/{base_name}.json'
 
         logger.info(f'json directory path: {json_full_path}')
 
-        s3.upload_file(json_file_path, images_bucket, json_full_path)
-        logger.info('Upload successfully the results to S3')
-
+        uploads.append(get_upload_executor().submit(
+            s3.put_object, Bucket=images_bucket, Key=json_full_path,
+            Body=json.dumps(prediction_summary).encode(), ContentType='application/json'))
 
+    # Wait for both uploads, an error in either one fails the request
+    for upload in uploads:
+        upload.result()
+    if uploads:
+        logger.info(f'prediction: {new_file_name}. Upload successfully the results to S3')
 
-        # TODO store the prediction_summary in MongoDB
-
-        try:
-            logger.info("Connecting to MongoDB...")
-            connection_string = f"mongodb://{primary_mongo_name}:27017/"
-            logger.info(f"Connection string: {connection_string}")
-
-            client = MongoClient(connection_string)
-            logger.info("MongoClient connected successfully.")
+    if labels:
+        # Store the prediction_summary in MongoDB without waiting for the insert
+        prediction_summary['_id'] = ObjectId()
+        summary_writer.put(prediction_summary)
 
-            db = client['mydatabase']
-            collection_name = 'prediction'
-            collection = db[collection_name]
-            logger.info("Inserting data...")
+        prediction_summary = convert_objectid(prediction_summary)
+        prediction_cache.put(image_hash, prediction_summary)
+        return prediction_summary
 
-            # Insert data into MongoDB
-            result = collection.insert_one(prediction_summary)
-
-            if result.acknowledged:
-                logger.info("Data inserted successfully.")
-            else:
-                logger.error("Failed to insert data into MongoDB.")
+    else:
+        return f'prediction: {prediction_id}/{original_img_path}. prediction result not found', 404
 
-            # Close MongoDB client connection
-            client.close()
 
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            # Handle the error or re-raise it depending on your requirements
-            raise
+def run_prediction_job(img_name, annotate):
+    result = run_prediction(img_name, annotate)
+    if isinstance(result, tuple):
+        return result
+    return result, 200
 
-        return convert_objectid(prediction_summary)
 
-    else:
-        return f'prediction: {prediction_id}/{original_img_path}. prediction result not found', 404
+prediction_jobs = JobQueue(run_prediction_job)
 
 
 if __name__ == "__main__":
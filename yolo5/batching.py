@@ -0,0 +1,93 @@
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+from loguru import logger
+from metrics import BATCH_SIZE, QUEUE_WAIT_SECONDS
+
+# Largest number of images in one forward pass
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+# How long the first request of a batch waits for more requests to join it
+BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', 15))
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent detection requests. Requests are collected until the batch is full
+    or the window of the first one ends, then the whole batch goes through one forward pass
+    and every request gets its own detections back.
+    """
+
+    def __init__(self, detector, max_batch_size=BATCH_MAX_SIZE, window_ms=BATCH_WINDOW_MS):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.requests = queue.Queue()
+        # Held while a batch runs, so the detector is only swapped between batches
+        self.detector_lock = threading.Lock()
+
+        self.worker = threading.Thread(target=self._run, name='yolo-batcher', daemon=True)
+        self.worker.start()
+        logger.info(f'Micro-batching up to {max_batch_size} images every {window_ms} ms')
+
+    def detect(self, img0):
+        """
+        Queue an image for the next batch and wait for its detections.
+
+        Parameters:
+            img0 (np.ndarray): BGR image as read by cv2.
+
+        Returns:
+            det (torch.Tensor): Detections (x1, y1, x2, y2, conf, cls) in img0 coordinates.
+            model_version (str): Version of the model that made them.
+        """
+        future = Future()
+        self.requests.put((img0, future, time.monotonic()))
+        return future.result()
+
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+
+            started = time.monotonic()
+            BATCH_SIZE.observe(len(batch))
+            for _, _, queued in batch:
+                QUEUE_WAIT_SECONDS.observe(started - queued)
+
+            try:
+                with self.detector_lock:
+                    dets = self.detector.detect_batch([img0 for img0, _, _ in batch])
+                    model_version = self.detector.model_version
+            except Exception as e:
+                logger.error(f'Batched detection failed: {e}')
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), det in zip(batch, dets):
+                future.set_result((det, model_version))
+
+    def swap_detector(self, detector):
+        """
+        Use another detector (e.g. with new weights) from the next batch on.
+
+        Parameters:
+            detector (Detector): The loaded detector.
+        """
+        with self.detector_lock:
+            self.detector = detector
+        logger.info(f'Detector swapped, model version {detector.model_version}')
@@ -0,0 +1,135 @@
+import numpy as np
+import torch
+from loguru import logger
+from prediction_cache import file_hash
+from models.common import DetectMultiBackend
+from utils.augmentations import letterbox
+from utils.general import check_img_size, non_max_suppression, scale_coords, xyxy2xywh
+from utils.plots import Annotator, colors
+from utils.torch_utils import select_device
+
+
+class Detector:
+    """
+    Resident YOLOv5 inference engine. The model is loaded and warmed up once, so every
+    prediction only pays for preprocessing, one forward pass and NMS.
+    The defaults are the ones detect.run() uses.
+    """
+
+    def __init__(self, weights='yolov5s.pt', data='data/coco128.yaml', imgsz=(640, 640),
+                 conf_thres=0.25, iou_thres=0.45, max_det=1000, device=''):
+        self.device = select_device(device)
+        # Hash of the weights this detector runs, predictions are cached under it.
+        # Replace the weights file atomically (rename), so the hash and the loaded model match.
+        self.model_version = file_hash(weights)
+        self.model = DetectMultiBackend(weights, device=self.device, data=data)
+        self.stride, self.names, self.pt = self.model.stride, self.model.names, self.model.pt
+        self.imgsz = check_img_size(imgsz, s=self.stride)
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.max_det = max_det
+
+        # Dummy forward pass, so the first request doesn't pay for lazy initialization.
+        # DetectMultiBackend.warmup() skips CPU devices, which is what this service runs on.
+        with torch.no_grad():
+            self.model(torch.zeros(1, 3, *self.imgsz, device=self.device,
+                                   dtype=torch.half if self.model.fp16 else torch.float))
+        logger.info(f'YOLOv5 model {weights} loaded on {self.device}')
+
+    def preprocess(self, img0):
+        """
+        Letterbox a BGR image and convert it to a normalized NCHW tensor, like LoadImages does.
+
+        Parameters:
+            img0 (np.ndarray): BGR image as read by cv2.
+
+        Returns:
+            torch.Tensor: Model input with a batch dimension.
+        """
+        im = letterbox(img0, self.imgsz, stride=self.stride, auto=self.pt)[0]
+        im = np.ascontiguousarray(im.transpose((2, 0, 1))[::-1])  # HWC to CHW, BGR to RGB
+        im = torch.from_numpy(im).to(self.device)
+        im = im.half() if self.model.fp16 else im.float()
+        im /= 255
+        return im[None]
+
+    @torch.no_grad()
+    def detect(self, img0):
+        """
+        Run one forward pass and NMS on an image.
+
+        Parameters:
+            img0 (np.ndarray): BGR image as read by cv2.
+
+        Returns:
+            torch.Tensor: Detections (x1, y1, x2, y2, conf, cls) in img0 coordinates.
+        """
+        return self.detect_batch([img0])[0]
+
+    @torch.no_grad()
+    def detect_batch(self, img0s):
+        """
+        Run NMS on several images, with one forward pass per letterboxed shape. Every image is
+        letterboxed as it would be alone, so its detections don't depend on the other images of the batch.
+
+        Parameters:
+            img0s (list): BGR images as read by cv2.
+
+        Returns:
+            list: Detections of every image, in img0 coordinates.
+        """
+        # Images of the same aspect ratio get the same letterboxed shape and share a forward pass
+        groups = {}
+        for i, img0 in enumerate(img0s):
+            im = self.preprocess(img0)
+            groups.setdefault(tuple(im.shape[2:]), []).append((i, im))
+
+        dets = [None] * len(img0s)
+        for shape, group in groups.items():
+            pred = self.model(torch.cat([im for _, im in group]))
+            for (i, _), det in zip(group, non_max_suppression(pred, self.conf_thres, self.iou_thres,
+                                                               max_det=self.max_det)):
+                if len(det):
+                    det[:, :4] = scale_coords(shape, det[:, :4], img0s[i].shape).round()
+                dets[i] = det
+        return dets
+
+    def labels(self, det, img0_shape, names):
+        """
+        Convert detections to the labels detect.run() writes with save_txt.
+
+        Parameters:
+            det (torch.Tensor): Detections returned by detect().
+            img0_shape (tuple): Shape of the original image.
+            names (list): Class names.
+
+        Returns:
+            list: Dictionaries with 'class', 'cx', 'cy', 'width' and 'height' (normalized).
+        """
+        gn = torch.tensor(img0_shape)[[1, 0, 1, 0]]  # normalization gain whwh
+        labels = []
+        for *xyxy, conf, cls in reversed(det):
+            xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()
+            # Rounded like the '%g' formatting of the labels .txt file
+            cx, cy, width, height = (float(f'{value:g}') for value in xywh)
+            labels.append({
+                'class': names[int(cls)],
+                'cx': cx,
+                'cy': cy,
+                'width': width,
+                'height': height,
+            })
+        return labels
+
+    def annotate(self, img0, det, names, line_width=3):
+        """
+        Draw the detections on a copy of the image, like detect.run() does.
+
+        Returns:
+            np.ndarray: Annotated BGR image.
+        """
+        annotator = Annotator(img0.copy(), line_width=line_width, example=str(names))
+        for *xyxy, conf, cls in reversed(det):
+            c = int(cls)
+            annotator.box_label(xyxy, f'{names[c]} {conf:.2f}', color=colors(c, True))
+        return annotator.result()
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import os
+import queue
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+import requests
+from loguru import logger
+
+# Number of predictions running at the same time
+PREDICT_WORKERS = int(os.environ.get('PREDICT_WORKERS', 4))
+# Number of predictions waiting for a worker before new jobs are rejected
+PREDICT_QUEUE_SIZE = int(os.environ.get('PREDICT_QUEUE_SIZE', 64))
+# Number of finished jobs kept for polling
+PREDICT_JOBS_KEPT = int(os.environ.get('PREDICT_JOBS_KEPT', 1000))
+# Seconds to wait for the callback URL to answer
+CALLBACK_TIMEOUT = float(os.environ.get('CALLBACK_TIMEOUT', 10))
+# Shared secret sent in the X-Callback-Secret header of the callbacks (see polybot's YOLO_CALLBACK_SECRET)
+YOLO_CALLBACK_SECRET = os.environ.get('YOLO_CALLBACK_SECRET')
+# Comma separated base URLs callbacks may be posted to (e.g. http://polybot_app:8443).
+# Jobs with any other callback URL are rejected, none are allowed by default.
+YOLO_CALLBACK_ALLOWED_URLS = [url.strip() for url in os.environ.get('YOLO_CALLBACK_ALLOWED_URLS', '').split(',')
+                              if url.strip()]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class CallbackNotAllowedError(Exception):
+    pass
+
+
+def is_allowed_callback(callback_url, allowed_urls=YOLO_CALLBACK_ALLOWED_URLS):
+    """
+    Parameters:
+        callback_url (str): Callback URL sent by a client.
+        allowed_urls (list): Base URLs callbacks may be posted to.
+
+    Returns:
+        bool: True if the URL has the scheme and host of an allowed base URL, and a path under it.
+    """
+    url = urlsplit(callback_url)
+    for allowed_url in allowed_urls:
+        allowed = urlsplit(allowed_url)
+        base_path = allowed.path.rstrip('/')
+        if (url.scheme, url.netloc) == (allowed.scheme, allowed.netloc) and \
+                (url.path == base_path or url.path.startswith(base_path + '/')):
+            return True
+    return False
+
+
+class JobQueue:
+    """
+    Bounded in-process queue of prediction jobs, run by a pool of worker threads.
+    A job can be polled by id, and its result is posted to its callback URL when it finishes.
+    """
+
+    def __init__(self, handler, workers=PREDICT_WORKERS, queue_size=PREDICT_QUEUE_SIZE, jobs_kept=PREDICT_JOBS_KEPT):
+        """
+        Parameters:
+            handler (callable): Called with the job arguments, returns (result, status_code).
+        """
+        self.handler = handler
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self.jobs_kept = jobs_kept
+        self.lock = threading.Lock()
+
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f'predict-worker-{i}', daemon=True).start()
+        logger.info(f'Prediction job queue started with {workers} workers and queue size {queue_size}')
+
+    def submit(self, callback_url=None, **kwargs):
+        """
+        Queue a job.
+
+        Parameters:
+            callback_url (str): Optional URL the job result is posted to, under YOLO_CALLBACK_ALLOWED_URLS.
+            kwargs: Arguments of the handler.
+
+        Returns:
+            str: The job id.
+
+        Raises:
+            CallbackNotAllowedError: If the callback URL is not under an allowed base URL.
+            QueueFullError: If the queue is full.
+        """
+        if callback_url and not is_allowed_callback(callback_url):
+            raise CallbackNotAllowedError('Callback URL is not allowed')
+
+        job_id = str(uuid.uuid4())
+        job = {'job_id': job_id, 'status': 'queued', 'submitted': time.time()}
+        with self.lock:
+            self.jobs[job_id] = job
+            self._forget_old_jobs()
+        try:
+            self.pending.put_nowait((job_id, callback_url, kwargs))
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job_id]
+            raise QueueFullError('Prediction queue is full')
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _forget_old_jobs(self):
+        while len(self.jobs) > self.jobs_kept:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest['status'] in ('queued', 'running'):
+                break
+            del self.jobs[oldest_id]
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+            return dict(self.jobs[job_id])
+
+    def _run(self):
+        while True:
+            job_id, callback_url, kwargs = self.pending.get()
+            self._update(job_id, status='running')
+            try:
+                result, status_code = self.handler(**kwargs)
+                job = self._update(job_id, status='done', status_code=status_code, result=result)
+            except Exception as e:
+                logger.error(f'Prediction job {job_id} failed: {e}')
+                job = self._update(job_id, status='failed', status_code=500, result={'error': str(e)})
+
+            if callback_url:
+                self._post_callback(callback_url, job)
+
+    def _post_callback(self, callback_url, job):
+        # The callback URL is never logged, it may carry credentials
+        headers = {'X-Callback-Secret': YOLO_CALLBACK_SECRET} if YOLO_CALLBACK_SECRET else {}
+        try:
+            # Not following redirects keeps the callback on the allowed host
+            response = requests.post(callback_url, json=job, headers=headers, timeout=CALLBACK_TIMEOUT,
+                                     allow_redirects=False)
+            if response.status_code >= 400:
+                logger.error(f"Callback for job {job['job_id']} answered {response.status_code}")
+        except Exception as e:
+            logger.error(f"Error calling back for job {job['job_id']}: {type(e).__name__}")
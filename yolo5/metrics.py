@@ -0,0 +1,24 @@
+from prometheus_client import Counter, Histogram
+
+BATCH_SIZE = Histogram(
+    'yolo_batch_size',
+    'Number of images in each batched forward pass',
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    'yolo_queue_wait_seconds',
+    'Time a prediction waited in the batching queue before its forward pass',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+PREDICTION_CACHE_HITS = Counter(
+    'yolo_prediction_cache_hits_total',
+    'Predictions answered from the content-hash cache',
+    ['tier'],
+)
+
+PREDICTION_CACHE_MISSES = Counter(
+    'yolo_prediction_cache_misses_total',
+    'Predictions that were not found in the content-hash cache',
+)
@@ -0,0 +1,111 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from loguru import logger
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+
+MONGO_REPLICA_SET = os.environ.get('MONGO_REPLICA_SET', 'myReplicaSet')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 20))
+# Summaries are inserted when this many are queued, or after MONGO_WRITE_FLUSH_MS
+MONGO_WRITE_BATCH_SIZE = int(os.environ.get('MONGO_WRITE_BATCH_SIZE', 50))
+MONGO_WRITE_FLUSH_MS = float(os.environ.get('MONGO_WRITE_FLUSH_MS', 500))
+# 'majority' or a number of members
+MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '1')
+
+
+def mongo_uri():
+    """
+    Replica-set URI of the three MongoDB containers from docker-compose.yaml,
+    so the driver discovers the primary itself.
+    """
+    hosts = [os.environ['mongo_primary_container_name']]
+    for secondary in ('mongo_secondary_1_container_name', 'mongo_secondary_2_container_name'):
+        if os.environ.get(secondary):
+            hosts.append(os.environ[secondary])
+    return f"mongodb://{','.join(f'{host}:27017' for host in hosts)}/?replicaSet={MONGO_REPLICA_SET}"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """
+    One pooled client for the whole process.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            uri = mongo_uri()
+            logger.info(f"Connection string: {uri}")
+            _client = MongoClient(uri, maxPoolSize=MONGO_MAX_POOL_SIZE, connect=False)
+        return _client
+
+
+def write_concern(value=MONGO_WRITE_CONCERN):
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+
+class WriteBehindQueue:
+    """
+    Inserts documents in the background with insert_many, by batch size or by time,
+    so requests don't wait for the database round trip.
+    """
+
+    def __init__(self, collection, batch_size=MONGO_WRITE_BATCH_SIZE, flush_ms=MONGO_WRITE_FLUSH_MS,
+                 concern=None):
+        self.collection = collection.with_options(write_concern=concern or write_concern())
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.documents = queue.Queue()
+        self.stopped = threading.Event()
+
+        self.worker = threading.Thread(target=self._run, name='mongo-write-behind', daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def put(self, document):
+        self.documents.put(document)
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.documents.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            logger.info(f"Inserted {len(result.inserted_ids)} prediction summaries into MongoDB.")
+        except Exception as e:
+            logger.error(f"Error inserting prediction summaries into MongoDB: {e}")
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self._flush(self._next_batch())
+
+    def close(self):
+        """
+        Stop the background thread and insert what is still queued.
+        """
+        self.stopped.set()
+        self.worker.join(timeout=self.flush_interval * 2)
+        remaining = []
+        while True:
+            try:
+                remaining.append(self.documents.get_nowait())
+            except queue.Empty:
+                break
+        self._flush(remaining)
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import copy
+import hashlib
+import os
+import threading
+import time
+from loguru import logger
+from metrics import PREDICTION_CACHE_HITS, PREDICTION_CACHE_MISSES
+
+# Number of prediction summaries kept in memory
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+# Seconds a summary stays in the memory cache
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Prediction summaries keyed on the hash of the image bytes. Lookups go to a bounded
+    in-memory LRU with a TTL first, then to the MongoDB prediction collection.
+    Entries are tied to the model version, so new weights never return stale predictions.
+    """
+
+    def __init__(self, collection, model_version, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        self.collection = collection
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.index_created = False
+
+    def get(self, image_hash, annotated=False):
+        """
+        Find the prediction summary of an image.
+
+        Parameters:
+            image_hash (str): content_hash() of the image bytes.
+            annotated (bool): Only return a summary that has an annotated image (predicted_img_path).
+
+        Returns:
+            dict: The stored prediction summary, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(image_hash)
+            if entry is not None:
+                expires, summary = entry
+                if expires <= time.monotonic():
+                    del self.entries[image_hash]
+                elif not annotated or summary.get('predicted_img_path'):
+                    self.entries.move_to_end(image_hash)
+                    PREDICTION_CACHE_HITS.labels(tier='memory').inc()
+                    return copy.deepcopy(summary)
+                # Otherwise it was predicted without annotation, look for an annotated one in MongoDB
+
+        try:
+            self.ensure_index()
+            query = {'image_hash': image_hash, 'model_version': self.model_version}
+            if annotated:
+                query['predicted_img_path'] = {'$ne': None}
+            summary = self.collection.find_one(query, sort=[('time', -1)])
+        except Exception as e:
+            logger.error(f'Prediction cache lookup in MongoDB failed: {e}')
+            summary = None
+
+        if summary is None:
+            PREDICTION_CACHE_MISSES.inc()
+            return None
+
+        PREDICTION_CACHE_HITS.labels(tier='mongo').inc()
+        self.put(image_hash, summary)
+        return summary
+
+    def put(self, image_hash, summary):
+        with self.lock:
+            # Made by the model before an invalidation
+            if summary.get('model_version') != self.model_version:
+                return
+            # Keep the annotated summary of the image, it answers both kinds of requests
+            entry = self.entries.get(image_hash)
+            if entry is not None and entry[1].get('predicted_img_path') and not summary.get('predicted_img_path'):
+                return
+            self.entries[image_hash] = (time.monotonic() + self.ttl, copy.deepcopy(summary))
+            self.entries.move_to_end(image_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, model_version=None):
+        """
+        Drop the memory cache, e.g. when the weights change.
+
+        Parameters:
+            model_version (str): New model version. Summaries stored in MongoDB for other versions are ignored.
+        """
+        with self.lock:
+            self.entries.clear()
+            if model_version is not None:
+                self.model_version = model_version
+        logger.info(f'Prediction cache invalidated, model version {self.model_version}')
+
+    def ensure_index(self):
+        if not self.index_created:
+            self.collection.create_index([('image_hash', 1), ('model_version', 1)])
+            self.index_created = True
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+# Size of the HTTP connection pool shared by all the threads of the process
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 50))
+# Objects above this size are transferred in parts
+S3_MULTIPART_THRESHOLD_MB = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8))
+# Number of parts transferred at the same time
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', 10))
+# Number of uploads running at the same time across all the requests
+S3_UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', 8))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_upload_executor = None
+
+
+def get_s3_client():
+    """
+    One S3 client for the whole process, so the connection pool is kept alive between requests.
+    boto3 clients are thread safe.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            session = boto3.session.Session()
+            _s3_client = session.client('s3', config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                retries={'max_attempts': 3, 'mode': 'standard'},
+            ))
+        return _s3_client
+
+
+def get_transfer_config():
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+        multipart_chunksize=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+        max_concurrency=S3_MAX_CONCURRENCY,
+    )
+
+
+def get_upload_executor():
+    """
+    Thread pool shared by all the requests, so the uploads of one prediction run in parallel.
+    """
+    global _upload_executor
+    with _s3_client_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(max_workers=S3_UPLOAD_WORKERS, thread_name_prefix='s3-upload')
+        return _upload_executor